@@ -1,10 +1,218 @@
 import json
 import os
+import base64
 import hashlib
+import hmac
+import importlib
+import math
 import secrets
-from datetime import datetime, timedelta
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+class LazyModule:
+    '''Импортирует модуль при первом обращении к атрибуту: OPTIONS и холодный старт обходятся без него'''
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+jwt = LazyModule('jwt')
+psycopg2 = LazyModule('psycopg2')
+psycopg2_extras = LazyModule('psycopg2.extras')
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '5'))
+DB_POOL_CHECK_AFTER = float(os.environ.get('DB_POOL_CHECK_AFTER', '30'))
+
+# Пул живёт на уровне модуля и переживает тёплые вызовы функции
+_db_pool = []
+_db_pool_cond = threading.Condition()
+_db_pool_stats = {'hits': 0, 'misses': 0, 'open': 0, 'discarded': 0, 'prepared': 0}
+
+# Контроль допуска (AIMD): лимит запросов в работе растёт на 1/лимит после каждого быстрого
+# SQL-запроса и умножается на ADMISSION_BACKOFF, когда запрос и сглаженная задержка выше цели
+# или пул исчерпан. Сверх лимита первыми отбрасываются запросы низкого приоритета
+ADMISSION_MIN_LIMIT = int(os.environ.get('ADMISSION_MIN_LIMIT', '2'))
+ADMISSION_MAX_LIMIT = int(os.environ.get('ADMISSION_MAX_LIMIT', str(DB_POOL_MAX_SIZE * 4)))
+ADMISSION_LATENCY_TARGET = float(os.environ.get('ADMISSION_LATENCY_TARGET', '0.25'))
+ADMISSION_BACKOFF = 0.75
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', '2'))
+# Доля лимита, доступная приоритету; критичные запросы (вход, регистрация, refresh) не отбрасываются
+ADMISSION_SHARES = {
+    'critical': None,
+    'normal': 1.0,
+    'low': float(os.environ.get('ADMISSION_LOW_PRIORITY_SHARE', '0.5')),
+}
+ROUTE_PRIORITIES = {
+    ('POST', 'register'): 'critical',
+    ('POST', 'login'): 'critical',
+    ('POST', 'refresh'): 'critical',
+    ('POST', 'maintenance'): 'low',
+}
+
+_admission = {'limit': float(ADMISSION_MAX_LIMIT), 'inflight': 0, 'latency': 0.0, 'decreased_at': 0.0, 'shed': 0}
+_admission_lock = threading.Lock()
+
+SESSION_TOKEN_DAYS = 30
+REFRESH_TOKEN_DAYS = 30
+
+# Поиск по хешу токена ограничен окном живых expires_at (срок жизни + день запаса на расхождение
+# часов), чтобы планировщик отсекал прошедшие и дальние будущие недельные секции
+# (token_hash не ключ секционирования, без окна проверяется индекс каждой секции)
+# Горячие запросы разбираются и планируются один раз на соединение (PREPARE), дальше только EXECUTE
+PREPARED_STATEMENTS = {
+    'auth_verify_session': f'''SELECT s.user_id, s.expires_at, u.email, u.full_name
+        FROM sessions s
+        JOIN users u ON s.user_id = u.id
+        WHERE s.token_hash = $1
+          AND s.expires_at > NOW() AND s.expires_at <= NOW() + make_interval(days => {SESSION_TOKEN_DAYS + 1})''',
+    'auth_refresh_user': f'''SELECT u.id, u.email, u.full_name
+        FROM refresh_tokens r
+        JOIN users u ON r.user_id = u.id
+        WHERE r.token_hash = $1 AND r.revoked IS NOT TRUE
+          AND r.expires_at > NOW() AND r.expires_at <= NOW() + make_interval(days => {REFRESH_TOKEN_DAYS + 1})''',
+}
+# id(соединения) -> имена уже подготовленных на нём запросов; запись удаляется вместе с соединением
+_prepared_by_conn = {}
+# Класс курсора с замером времени запросов создаётся при первом соединении
+_timed_cursor_class = None
+
+SESSION_CACHE_MAX_SIZE = int(os.environ.get('SESSION_CACHE_MAX_SIZE', '2048'))
+# Выход сбрасывает кеш только на своём экземпляре; на остальных удалённая сессия
+# живёт в кеше до истечения TTL, поэтому TTL короткий и ограничен сверху
+SESSION_CACHE_MAX_TTL = 30.0
+SESSION_CACHE_TTL = min(float(os.environ.get('SESSION_CACHE_TTL', '15')), SESSION_CACHE_MAX_TTL)
+SESSION_CACHE_NEGATIVE_TTL = float(os.environ.get('SESSION_CACHE_NEGATIVE_TTL', '10'))
+
+# LRU-кеш результатов verify: sha256(token) -> (годен до, сессия или None)
+_session_cache = OrderedDict()
+_session_cache_lock = threading.Lock()
+
+# Отметки активности копятся в памяти и пишутся в users одним UPDATE раз в интервал;
+# при остановке экземпляра теряется не больше одного интервала отметок
+ACTIVITY_FLUSH_INTERVAL = float(os.environ.get('ACTIVITY_FLUSH_INTERVAL', '30'))
+ACTIVITY_BUFFER_MAX_SIZE = int(os.environ.get('ACTIVITY_BUFFER_MAX_SIZE', '5000'))
+
+# user_id -> [последний визит, последний вход или None]; _activity_since — monotonic самой старой отметки
+_activity = {}
+_activity_since = None
+_activity_lock = threading.Lock()
+
+# Попытки входа и регистрации: локальная корзина жетонов на ключ отсекает перебор без обращения
+# к БД, общая таблица auth_throttle со счётчиками окна даёт точность между экземплярами
+THROTTLE_WINDOW = int(os.environ.get('THROTTLE_WINDOW', '60'))
+THROTTLE_EMAIL_LIMIT = int(os.environ.get('THROTTLE_EMAIL_LIMIT', '10'))
+THROTTLE_IP_LIMIT = int(os.environ.get('THROTTLE_IP_LIMIT', '30'))
+THROTTLE_SYNC_INTERVAL = float(os.environ.get('THROTTLE_SYNC_INTERVAL', '2'))
+THROTTLE_MAX_KEYS = int(os.environ.get('THROTTLE_MAX_KEYS', '10000'))
+
+# 16 байт sha256('email:...' или 'ip:...') -> состояние корзины; LRU по последнему обращению
+_throttle = OrderedDict()
+_throttle_lock = threading.Lock()
+_throttle_synced_at = 0.0
+
+# Фоновые записи (активность, счётчики попыток) выполняет один поток за раз
+_buffers_flush_lock = threading.Lock()
+
+# 'session' — непрозрачные токены в таблице sessions, 'jwt' — подписанные access-токены
+AUTH_TOKEN_MODE = os.environ.get('AUTH_TOKEN_MODE', 'session')
+ACCESS_TOKEN_TTL = int(os.environ.get('ACCESS_TOKEN_TTL', '900'))
+
+# sessions и refresh_tokens секционированы по expires_at, одна секция на неделю (с понедельника)
+PARTITIONED_TABLES = ('sessions', 'refresh_tokens')
+PARTITION_WEEKS_AHEAD = int(os.environ.get('PARTITION_WEEKS_AHEAD', '9'))
+PARTITION_LOCK_TIMEOUT = os.environ.get('PARTITION_LOCK_TIMEOUT', '2s')
+
+SCRYPT_N = int(os.environ.get('SCRYPT_N', str(2 ** 14)))
+SCRYPT_R = int(os.environ.get('SCRYPT_R', '8'))
+SCRYPT_P = int(os.environ.get('SCRYPT_P', '1'))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', '16'))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '5'))
+# Хеш-заглушка с текущими параметрами: для неизвестного email scrypt считается так же,
+# как для известного, и по времени ответа нельзя узнать, зарегистрирован ли адрес
+DUMMY_PASSWORD_HASH = '$'.join([
+    'scrypt', str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P),
+    base64.b64encode(bytes(16)).decode(), base64.b64encode(bytes(32)).decode()
+])
+
+# hashlib.scrypt отпускает GIL, поэтому пул потоков даёт настоящий параллелизм,
+# а лимит очереди не даёт всплеску входов раздуть задержку
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='kdf')
+_hash_lock = threading.Lock()
+_hash_stats = {'pending': 0, 'max_pending': 0, 'completed': 0, 'rejected': 0, 'timed_out': 0}
+
+# Отозванные access-токены: jti -> exp; записи живут не дольше самого токена
+_revoked_jti = {}
+_revoked_jti_lock = threading.Lock()
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class FrozenHeaders(dict):
+    '''Заголовки, собранные один раз при загрузке модуля и общие для всех ответов'''
+    
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('FrozenHeaders нельзя изменять, скопируйте через dict(...)')
+    
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+
+JSON_HEADERS = FrozenHeaders({
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+})
+OPTIONS_HEADERS = FrozenHeaders({
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization',
+    'Access-Control-Max-Age': '86400'
+})
+_retry_headers = {}
+
+def _json_default(value):
+    return str(value)
+
+def dump_json(body) -> str:
+    '''Сериализует тело ответа: orjson, если установлен, иначе стандартный json'''
+    if orjson is not None:
+        return orjson.dumps(
+            body,
+            default=_json_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        ).decode()
+    return json.dumps(body, default=_json_default)
+
+def json_response(status: int, body, headers: dict = JSON_HEADERS) -> dict:
+    return {
+        'statusCode': status,
+        'headers': headers,
+        'body': dump_json(body),
+        'isBase64Encoded': False
+    }
+
+def error_response(status: int, message: str, retry_after: Optional[int] = None, **extra) -> dict:
+    '''Единый формат ошибок: {"error": сообщение, ...}'''
+    headers = JSON_HEADERS
+    if retry_after is not None:
+        if retry_after not in _retry_headers:
+            _retry_headers[retry_after] = FrozenHeaders({**JSON_HEADERS, 'Retry-After': str(retry_after)})
+        headers = _retry_headers[retry_after]
+    return json_response(status, {'error': message, **extra}, headers)
+
+def options_response() -> dict:
+    return {'statusCode': 200, 'headers': OPTIONS_HEADERS, 'body': '', 'isBase64Encoded': False}
 
 def handler(event: dict, context) -> dict:
     '''API для регистрации, входа и проверки авторизации пользователей'''
@@ -12,57 +220,634 @@ def handler(event: dict, context) -> dict:
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return options_response()
     
     path = event.get('queryStringParameters', {}).get('action', '')
     
+    if not admit(ROUTE_PRIORITIES.get((method, path), 'normal')):
+        return error_response(503, 'Сервер перегружен, повторите попытку', retry_after=ADMISSION_RETRY_AFTER)
+    try:
+        return route_request(event, method, path)
+    finally:
+        release_admission()
+        flush_buffers_if_due()
+
+def route_request(event: dict, method: str, path: str) -> dict:
+    '''Выбирает обработчик по методу и action'''
     if method == 'POST':
         if path == 'register':
             return register_user(event)
         elif path == 'login':
             return login_user(event)
+        elif path == 'refresh':
+            return refresh_access_token(event)
+        elif path == 'logout':
+            return logout_user(event)
+        elif path == 'maintenance':
+            return run_maintenance(event)
     elif method == 'GET':
         if path == 'verify':
             return verify_session(event)
     
-    return {
-        'statusCode': 400,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': json.dumps({'error': 'Invalid action'}),
-        'isBase64Encoded': False
-    }
+    return error_response(400, 'Invalid action')
 
-def get_db_connection():
-    '''Создаёт соединение с базой данных'''
+def timed_cursor_class():
+    '''Курсор, который сообщает контролю допуска время выполнения каждого запроса'''
+    global _timed_cursor_class
+    if _timed_cursor_class is None:
+        class TimedCursor(psycopg2_extras.RealDictCursor):
+            def execute(self, query, vars=None):
+                started = time.monotonic()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    observe_db_latency(time.monotonic() - started)
+        _timed_cursor_class = TimedCursor
+    return _timed_cursor_class
+
+def _open_db_connection():
+    '''Создаёт новое соединение с базой данных'''
     return psycopg2.connect(
         os.environ['DATABASE_URL'],
-        cursor_factory=RealDictCursor,
+        cursor_factory=timed_cursor_class(),
         options=f"-c search_path={os.environ['MAIN_DB_SCHEMA']}"
     )
 
+def _is_connection_healthy(conn, idle_since: float) -> bool:
+    '''Проверяет соединение перед повторным использованием'''
+    if conn.closed:
+        return False
+    if time.monotonic() - idle_since < DB_POOL_CHECK_AFTER:
+        return True
+    try:
+        # Пинг в autocommit не открывает транзакцию, и откатывать после него нечего
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        finally:
+            conn.autocommit = False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _discard_db_connection(conn) -> None:
+    '''Закрывает соединение и освобождает место в пуле'''
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+    with _db_pool_cond:
+        _prepared_by_conn.pop(id(conn), None)
+        _db_pool_stats['open'] -= 1
+        _db_pool_stats['discarded'] += 1
+        _db_pool_cond.notify()
+
+def get_db_connection():
+    '''Берёт соединение из пула или открывает новое, если пул не заполнен'''
+    try:
+        return _checkout_db_connection()
+    except psycopg2.OperationalError:
+        observe_db_latency(None)
+        raise
+
+def _checkout_db_connection(wait: bool = True):
+    '''Без wait не ждёт освобождения соединения и возвращает None, если пул исчерпан'''
+    deadline = time.monotonic() + DB_POOL_WAIT_TIMEOUT
+    while True:
+        with _db_pool_cond:
+            while not _db_pool and _db_pool_stats['open'] >= DB_POOL_MAX_SIZE:
+                if not wait:
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise psycopg2.OperationalError('Пул соединений исчерпан')
+                _db_pool_cond.wait(remaining)
+            if not _db_pool:
+                _db_pool_stats['open'] += 1
+                _db_pool_stats['misses'] += 1
+                break
+            conn, idle_since = _db_pool.pop()
+        if _is_connection_healthy(conn, idle_since):
+            with _db_pool_cond:
+                _db_pool_stats['hits'] += 1
+            return conn
+        _discard_db_connection(conn)
+
+    try:
+        return _open_db_connection()
+    except Exception:
+        with _db_pool_cond:
+            _db_pool_stats['open'] -= 1
+            _db_pool_cond.notify()
+        raise
+
+def release_db_connection(conn) -> None:
+    '''Возвращает соединение в пул, откатывая незавершённую транзакцию'''
+    if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+    if conn.closed or conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        _discard_db_connection(conn)
+        return
+    with _db_pool_cond:
+        _db_pool.append((conn, time.monotonic()))
+        _db_pool_cond.notify()
+
+def get_pool_stats() -> dict:
+    '''Счётчики пула: попадания, промахи и открытые соединения'''
+    with _db_pool_cond:
+        return {**_db_pool_stats, 'idle': len(_db_pool), 'max_size': DB_POOL_MAX_SIZE}
+
+def admit(priority: str) -> bool:
+    '''Пропускает запрос, пока запросов в работе меньше его доли лимита; критичные проходят всегда'''
+    share = ADMISSION_SHARES[priority]
+    with _admission_lock:
+        if share is not None and _admission['inflight'] >= _admission['limit'] * share:
+            _admission['shed'] += 1
+            return False
+        _admission['inflight'] += 1
+        return True
+
+def release_admission() -> None:
+    with _admission_lock:
+        _admission['inflight'] -= 1
+
+def observe_db_latency(seconds: Optional[float]) -> None:
+    '''Шаг AIMD по времени выполнения запроса; None — соединение получить не удалось'''
+    now = time.monotonic()
+    with _admission_lock:
+        slow = seconds is None or seconds > ADMISSION_LATENCY_TARGET
+        if seconds is not None:
+            # Один долгий запрос (пакетная вставка, обслуживание) не должен держать среднее выше цели
+            seconds = min(seconds, ADMISSION_LATENCY_TARGET * 4)
+            previous = _admission['latency']
+            _admission['latency'] = seconds if not previous else previous * 0.8 + seconds * 0.2
+        # Уменьшает лимит только медленный запрос при высокой средней, и не чаще раза за интервал цели
+        if slow and (seconds is None or _admission['latency'] > ADMISSION_LATENCY_TARGET):
+            if now - _admission['decreased_at'] >= ADMISSION_LATENCY_TARGET:
+                _admission['limit'] = max(ADMISSION_MIN_LIMIT, _admission['limit'] * ADMISSION_BACKOFF)
+                _admission['decreased_at'] = now
+        elif not slow:
+            _admission['limit'] = min(ADMISSION_MAX_LIMIT, _admission['limit'] + 1 / _admission['limit'])
+
+def get_admission_stats() -> dict:
+    '''Текущий лимит, запросы в работе, сглаженная задержка и число отброшенных'''
+    with _admission_lock:
+        return {**_admission, 'limit': round(_admission['limit'], 2)}
+
+def execute_prepared(cursor, name: str, params: tuple) -> None:
+    '''Выполняет запрос из PREPARED_STATEMENTS; PREPARE делается при первом использовании на соединении'''
+    conn = cursor.connection
+    with _db_pool_cond:
+        prepared = _prepared_by_conn.setdefault(id(conn), set())
+    fresh_transaction = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    if name not in prepared:
+        _prepare_statement(cursor, name, prepared)
+    execute = f"EXECUTE {name}({', '.join(['%s'] * len(params))})"
+    try:
+        cursor.execute(execute, params)
+    except psycopg2.Error as e:
+        # 26000: сервер больше не знает запрос (соединение пересоздано, DISCARD ALL в пулере)
+        if e.pgcode != '26000':
+            raise
+        prepared.clear()
+        if not fresh_transaction:
+            raise
+        conn.rollback()
+        _prepare_statement(cursor, name, prepared)
+        cursor.execute(execute, params)
+
+def _prepare_statement(cursor, name: str, prepared: set) -> None:
+    cursor.execute(f'PREPARE {name} AS {PREPARED_STATEMENTS[name]}')
+    prepared.add(name)
+    with _db_pool_cond:
+        _db_pool_stats['prepared'] += 1
+
+class PasswordHasherBusy(Exception):
+    '''Очередь хеширования переполнена — запрос нужно повторить позже'''
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p,
+        maxmem=128 * r * (n + p + 2) + 2 ** 20, dklen=32
+    )
+
+def _hash_task_done(future) -> None:
+    '''Задача покидает очередь, только когда выполнена или отменена, а не когда вызывающий перестал ждать'''
+    with _hash_lock:
+        _hash_stats['pending'] -= 1
+        if not future.cancelled():
+            _hash_stats['completed'] += 1
+
+def _run_on_hash_pool(fn, *args):
+    '''Выполняет KDF в ограниченном пуле потоков с учётом глубины очереди'''
+    with _hash_lock:
+        if _hash_stats['pending'] >= PASSWORD_HASH_QUEUE_LIMIT:
+            _hash_stats['rejected'] += 1
+            raise PasswordHasherBusy()
+        _hash_stats['pending'] += 1
+        _hash_stats['max_pending'] = max(_hash_stats['max_pending'], _hash_stats['pending'])
+    future = _hash_executor.submit(fn, *args)
+    future.add_done_callback(_hash_task_done)
+    try:
+        return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+    except FutureTimeoutError:
+        # Ещё не начатая задача снимается с очереди; начатая доработает и освободит место сама
+        future.cancel()
+        with _hash_lock:
+            _hash_stats['timed_out'] += 1
+        raise PasswordHasherBusy()
+
+def get_hash_stats() -> dict:
+    '''Метрики пула хеширования: глубина очереди, выполненные и отклонённые задачи'''
+    with _hash_lock:
+        return {**_hash_stats, 'workers': PASSWORD_HASH_WORKERS, 'queue_limit': PASSWORD_HASH_QUEUE_LIMIT}
+
 def hash_password(password: str) -> str:
-    '''Хеширует пароль с использованием SHA-256'''
-    return hashlib.sha256(password.encode()).hexdigest()
+    '''Хеширует пароль через scrypt с солью; формат scrypt$n$r$p$соль$хеш'''
+    salt = secrets.token_bytes(16)
+    digest = _run_on_hash_pool(_scrypt, password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return '$'.join([
+        'scrypt', str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P),
+        base64.b64encode(salt).decode(), base64.b64encode(digest).decode()
+    ])
+
+def verify_password(password: str, stored_hash: str) -> tuple:
+    '''Проверяет пароль; возвращает (совпал, нужно ли перехешировать)'''
+    if not stored_hash:
+        return False, False
+    if not stored_hash.startswith('scrypt$'):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored_hash), True
+    _, n, r, p, salt, expected = stored_hash.split('$')
+    n, r, p = int(n), int(r), int(p)
+    digest = _run_on_hash_pool(_scrypt, password, base64.b64decode(salt), n, r, p)
+    matches = hmac.compare_digest(digest, base64.b64decode(expected))
+    return matches, (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+def calibrate_scrypt(target_ms: float = 100, r: int = 8, p: int = 1, rounds: int = 5) -> dict:
+    '''Подбирает SCRYPT_N под целевое время одного хеша на текущем железе'''
+    import statistics
+    n = 2 ** 12
+    while True:
+        timings = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            _scrypt('calibration-password', secrets.token_bytes(16), n, r, p)
+            timings.append((time.perf_counter() - started) * 1000)
+        median_ms = statistics.median(timings)
+        if median_ms >= target_ms or n >= 2 ** 20:
+            return {'n': n, 'r': r, 'p': p, 'median_ms': round(median_ms, 2), 'target_ms': target_ms}
+        n *= 2
 
 def generate_token() -> str:
     '''Генерирует случайный токен для сессии'''
     return secrets.token_urlsafe(32)
 
+def uses_signed_tokens() -> bool:
+    '''Включён ли режим подписанных access-токенов'''
+    return AUTH_TOKEN_MODE == 'jwt'
+
+def get_jwt_secret() -> str:
+    '''Секрет для подписи JWT, общий с функцией telegram-auth'''
+    secret = os.environ.get('JWT_SECRET', '')
+    if len(secret) < 32:
+        raise ValueError('JWT_SECRET не настроен')
+    return secret
+
+def hash_token(token: str) -> bytes:
+    '''Токены сессий и refresh-токены хранятся в БД только как 32-байтный SHA-256'''
+    return hashlib.sha256(token.encode()).digest()
+
+def create_access_token(user: dict) -> str:
+    '''Выпускает короткоживущий подписанный access-токен'''
+    now = datetime.now(timezone.utc)
+    payload = {
+        'user_id': user['id'],
+        'email': user['email'],
+        'full_name': user['full_name'],
+        'jti': secrets.token_urlsafe(12),
+        'iat': now,
+        'exp': now + timedelta(seconds=ACCESS_TOKEN_TTL)
+    }
+    return jwt.encode(payload, get_jwt_secret(), algorithm='HS256')
+
+def decode_access_token(token: str) -> Optional[dict]:
+    '''Проверяет подпись и срок токена без обращения к БД'''
+    try:
+        payload = jwt.decode(token, get_jwt_secret(), algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None
+    if is_access_token_revoked(payload.get('jti')):
+        return None
+    return payload
+
+def revoke_access_token(payload: dict) -> None:
+    '''Добавляет jti в набор отозванных до истечения токена'''
+    jti = payload.get('jti')
+    if not jti:
+        return
+    now = time.time()
+    with _revoked_jti_lock:
+        for key in [key for key, exp in _revoked_jti.items() if exp <= now]:
+            del _revoked_jti[key]
+        _revoked_jti[jti] = payload.get('exp', now + ACCESS_TOKEN_TTL)
+
+def is_access_token_revoked(jti: Optional[str]) -> bool:
+    if not jti:
+        return False
+    with _revoked_jti_lock:
+        return jti in _revoked_jti
+
+def new_session_secret() -> tuple:
+    '''Секрет новой сессии: (токен клиенту, ключ в БД, таблица, колонка ключа, срок)'''
+    token = generate_token()
+    if uses_signed_tokens():
+        expires_at = datetime.now() + timedelta(days=REFRESH_TOKEN_DAYS)
+        return token, hash_token(token), 'refresh_tokens', 'token_hash', expires_at
+    return token, hash_token(token), 'sessions', 'token_hash', datetime.now() + timedelta(days=SESSION_TOKEN_DAYS)
+
+def credentials_response(user: dict, token: str) -> dict:
+    '''Поля ответа с токенами для уже сохранённой сессии'''
+    if not uses_signed_tokens():
+        return {'token': token}
+    return {
+        'token': create_access_token(user),
+        'refresh_token': token,
+        'expires_in': ACCESS_TOKEN_TTL
+    }
+
+def issue_credentials(cursor, user: dict) -> dict:
+    '''Создаёт сессию или пару access/refresh-токенов в зависимости от режима'''
+    token, key, table, column, expires_at = new_session_secret()
+    cursor.execute(
+        f"INSERT INTO {table} (user_id, {column}, expires_at) VALUES (%s, %s, %s)",
+        (user['id'], key, expires_at)
+    )
+    return credentials_response(user, token)
+
+def _session_cache_key(token: str) -> bytes:
+    '''Ключ кеша — хеш токена, чтобы не держать сами токены в памяти'''
+    return hash_token(token)
+
+def get_cached_session(token: str):
+    '''Возвращает (найдено, сессия); сессия None означает закешированный отказ'''
+    key = _session_cache_key(token)
+    with _session_cache_lock:
+        entry = _session_cache.get(key)
+        if entry is None:
+            return False, None
+        cached_until, session = entry
+        if time.monotonic() >= cached_until:
+            del _session_cache[key]
+            return False, None
+        _session_cache.move_to_end(key)
+        return True, session
+
+def cache_session(token: str, session) -> None:
+    '''Кладёт результат проверки в кеш, не дольше срока жизни самой сессии'''
+    ttl = SESSION_CACHE_NEGATIVE_TTL
+    if session is not None:
+        session = dict(session)
+        remaining = (session['expires_at'] - datetime.now()).total_seconds()
+        ttl = min(SESSION_CACHE_TTL, remaining) if remaining > 0 else SESSION_CACHE_NEGATIVE_TTL
+    key = _session_cache_key(token)
+    with _session_cache_lock:
+        _session_cache[key] = (time.monotonic() + ttl, session)
+        _session_cache.move_to_end(key)
+        while len(_session_cache) > SESSION_CACHE_MAX_SIZE:
+            _session_cache.popitem(last=False)
+
+def invalidate_cached_session(token: str) -> None:
+    '''Хук для выхода из системы: сбрасывает кеш для одного токена на этом экземпляре'''
+    with _session_cache_lock:
+        _session_cache.pop(_session_cache_key(token), None)
+
+def invalidate_cached_user_sessions(user_id: int) -> None:
+    '''Хук для смены пароля: сбрасывает все закешированные сессии пользователя'''
+    with _session_cache_lock:
+        stale = [key for key, (_, session) in _session_cache.items()
+                 if session is not None and session['user_id'] == user_id]
+        for key in stale:
+            del _session_cache[key]
+
+def record_activity(user_id: int, login: bool = False) -> None:
+    '''Запоминает визит (и вход) пользователя; повторные отметки до сброса схлопываются в одну'''
+    global _activity_since
+    now = datetime.now()
+    with _activity_lock:
+        entry = _activity.setdefault(user_id, [now, None])
+        entry[0] = now
+        if login:
+            entry[1] = now
+        if _activity_since is None:
+            _activity_since = time.monotonic()
+
+def activity_flush_due() -> bool:
+    '''Пора сбрасывать: буфер заполнен или самой старой отметке больше интервала'''
+    with _activity_lock:
+        if not _activity:
+            return False
+        return (len(_activity) >= ACTIVITY_BUFFER_MAX_SIZE
+                or time.monotonic() - _activity_since >= ACTIVITY_FLUSH_INTERVAL)
+
+def _take_activity() -> list:
+    '''Забирает весь буфер; строки отсортированы по id, чтобы параллельные сбросы брали блокировки в одном порядке'''
+    global _activity_since
+    with _activity_lock:
+        rows = sorted((user_id, seen, login) for user_id, (seen, login) in _activity.items())
+        _activity.clear()
+        _activity_since = None
+    return rows
+
+def _restore_activity(rows: list) -> None:
+    '''Возвращает несохранённые отметки в буфер, не затирая более свежие'''
+    global _activity_since
+    with _activity_lock:
+        for user_id, seen, login in rows:
+            entry = _activity.setdefault(user_id, [seen, login])
+            entry[0] = max(entry[0], seen)
+            if login and (entry[1] is None or entry[1] < login):
+                entry[1] = login
+        if _activity and _activity_since is None:
+            _activity_since = time.monotonic()
+
+def flush_activity(conn) -> int:
+    '''Пишет буфер одним UPDATE ... FROM (VALUES ...); при ошибке отметки возвращаются в буфер'''
+    rows = _take_activity()
+    if not rows:
+        return 0
+    # Курсор без замера: фоновая запись не должна влиять на контроль допуска
+    cursor = conn.cursor(cursor_factory=psycopg2_extras.RealDictCursor)
+    try:
+        psycopg2_extras.execute_values(
+            cursor,
+            '''UPDATE users u
+               SET last_seen_at = GREATEST(u.last_seen_at, v.seen_at),
+                   last_login_at = GREATEST(u.last_login_at, v.login_at)
+               FROM (VALUES %s) AS v(id, seen_at, login_at)
+               WHERE u.id = v.id''',
+            rows,
+            template='(%s, %s::timestamp, %s::timestamp)',
+            page_size=len(rows)
+        )
+        conn.commit()
+        return len(rows)
+    except Exception:
+        conn.rollback()
+        _restore_activity(rows)
+        raise
+    finally:
+        cursor.close()
+
+def throttle_key(kind: str, value: str) -> bytes:
+    '''Компактный ключ счётчика: сами email и IP не хранятся ни в памяти, ни в БД'''
+    return hashlib.sha256(f'{kind}:{value}'.encode()).digest()[:16]
+
+def client_ip(event: dict) -> str:
+    '''IP клиента из контекста запроса, иначе первый адрес X-Forwarded-For'''
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    if identity.get('sourceIp'):
+        return identity['sourceIp']
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    return headers.get('x-forwarded-for', '').split(',')[0].strip()
+
+def throttle_limits(event: dict, email: str) -> list:
+    '''Ключи и лимиты, которые проверяются для попытки входа или регистрации'''
+    limits = [(throttle_key('email', email), THROTTLE_EMAIL_LIMIT)]
+    ip = client_ip(event)
+    if ip:
+        limits.append((throttle_key('ip', ip), THROTTLE_IP_LIMIT))
+    return limits
+
+def check_throttle(limits: list) -> int:
+    '''Берёт жетон из корзины каждого ключа; 0 — попытка разрешена, иначе секунды до следующей. Только память'''
+    now = time.monotonic()
+    wait = 0.0
+    entries = []
+    with _throttle_lock:
+        for key, limit in limits:
+            entry = _throttle.get(key)
+            if entry is None:
+                entry = _throttle[key] = {
+                    'tokens': float(limit), 'updated': now, 'pending': 0, 'blocked_until': 0.0, 'limit': limit
+                }
+            else:
+                _throttle.move_to_end(key)
+                entry['tokens'] = min(limit, entry['tokens'] + (now - entry['updated']) * limit / THROTTLE_WINDOW)
+                entry['updated'] = now
+            if entry['blocked_until'] > now:
+                wait = max(wait, entry['blocked_until'] - now)
+            elif entry['tokens'] < 1:
+                wait = max(wait, (1 - entry['tokens']) * THROTTLE_WINDOW / limit)
+            entries.append(entry)
+        if not wait:
+            for entry in entries:
+                entry['tokens'] -= 1
+                entry['pending'] += 1
+        while len(_throttle) > THROTTLE_MAX_KEYS:
+            _throttle.popitem(last=False)
+    return math.ceil(wait)
+
+def throttle_sync_due() -> bool:
+    '''Есть неотправленные попытки и с прошлой синхронизации прошло THROTTLE_SYNC_INTERVAL'''
+    with _throttle_lock:
+        if time.monotonic() - _throttle_synced_at < THROTTLE_SYNC_INTERVAL:
+            return False
+        return any(entry['pending'] for entry in _throttle.values())
+
+def sync_throttle(conn) -> int:
+    '''Добавляет локальные попытки в счётчики текущего окна одним запросом и блокирует ключи,
+    исчерпавшие лимит суммарно по всем экземплярам, до конца окна'''
+    global _throttle_synced_at
+    window_id = int(time.time() // THROTTLE_WINDOW)
+    with _throttle_lock:
+        _throttle_synced_at = time.monotonic()
+        pending = []
+        for key, entry in _throttle.items():
+            if entry['pending']:
+                pending.append((key, window_id, entry['pending']))
+                entry['pending'] = 0
+    if not pending:
+        return 0
+    pending.sort()
+    # Курсор без замера: фоновая запись не должна влиять на контроль допуска
+    cursor = conn.cursor(cursor_factory=psycopg2_extras.RealDictCursor)
+    try:
+        rows = psycopg2_extras.execute_values(
+            cursor,
+            '''INSERT INTO auth_throttle (key, window_id, hits) VALUES %s
+               ON CONFLICT (key, window_id) DO UPDATE SET hits = auth_throttle.hits + EXCLUDED.hits
+               RETURNING key, hits''',
+            pending,
+            page_size=len(pending),
+            fetch=True
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        with _throttle_lock:
+            for key, _, hits in pending:
+                if key in _throttle:
+                    _throttle[key]['pending'] += hits
+        raise
+    finally:
+        cursor.close()
+    
+    blocked_until = time.monotonic() + max((window_id + 1) * THROTTLE_WINDOW - time.time(), 0)
+    with _throttle_lock:
+        for row in rows:
+            entry = _throttle.get(bytes(row['key']))
+            if entry and row['hits'] >= entry['limit']:
+                entry['blocked_until'] = max(entry['blocked_until'], blocked_until)
+    return len(pending)
+
+def purge_throttle_counters(conn) -> int:
+    '''Удаляет счётчики прошедших окон'''
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            'DELETE FROM auth_throttle WHERE window_id < %s',
+            (int(time.time() // THROTTLE_WINDOW) - 1,)
+        )
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+def flush_buffers_if_due() -> None:
+    '''Сброс отложенных записей попутно с запросами: одним потоком, одним соединением и только когда пора;
+    ошибка не влияет на ответ, данные остаются в буферах до следующей попытки.
+    Соединение берётся без ожидания и мимо контроля допуска: при исчерпанном пуле сброс
+    пропускается, а не задерживает ответ и не снижает лимит запросов'''
+    jobs = [flush for due, flush in ((activity_flush_due, flush_activity), (throttle_sync_due, sync_throttle)) if due()]
+    if not jobs or not _buffers_flush_lock.acquire(blocking=False):
+        return
+    conn = None
+    try:
+        conn = _checkout_db_connection(wait=False)
+        if conn is None:
+            return
+        for flush in jobs:
+            try:
+                flush(conn)
+            except Exception:
+                pass
+    except Exception:
+        pass
+    finally:
+        if conn:
+            release_db_connection(conn)
+        _buffers_flush_lock.release()
+
 def register_user(event: dict) -> dict:
     '''Регистрация нового пользователя'''
+    conn = None
     try:
         body = json.loads(event.get('body', '{}'))
         email = body.get('email', '').strip().lower()
@@ -71,256 +856,391 @@ def register_user(event: dict) -> dict:
         phone = body.get('phone', '').strip()
         
         if not email or not password or not full_name:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Email, пароль и имя обязательны'}),
-                'isBase64Encoded': False
-            }
+            return error_response(400, 'Email, пароль и имя обязательны')
         
         if len(password) < 6:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Пароль должен быть не менее 6 символов'}),
-                'isBase64Encoded': False
-            }
+            return error_response(400, 'Пароль должен быть не менее 6 символов')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-        if cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return {
-                'statusCode': 409,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Пользователь с таким email уже существует'}),
-                'isBase64Encoded': False
-            }
+        retry_after = check_throttle(throttle_limits(event, email))
+        if retry_after:
+            return error_response(429, 'Слишком много попыток, повторите позже', retry_after=retry_after)
         
         password_hash = hash_password(password)
         
+        token, key, table, column, expires_at = new_session_secret()
+        
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        # Пользователь и сессия создаются одним запросом и одним коммитом;
+        # ON CONFLICT заменяет гоночную предварительную проверку email
         cursor.execute(
-            "INSERT INTO users (email, password_hash, full_name, phone) VALUES (%s, %s, %s, %s) RETURNING id, email, full_name",
-            (email, password_hash, full_name, phone if phone else None)
+            f'''WITH new_user AS (
+                   INSERT INTO users (email, password_hash, full_name, phone)
+                   VALUES (%s, %s, %s, %s)
+                   ON CONFLICT (email) DO NOTHING
+                   RETURNING id, email, full_name
+               ), new_session AS (
+                   INSERT INTO {table} (user_id, {column}, expires_at)
+                   SELECT id, %s, %s FROM new_user
+               )
+               SELECT id, email, full_name FROM new_user''',
+            (email, password_hash, full_name, phone if phone else None, key, expires_at)
         )
         user = cursor.fetchone()
         conn.commit()
         
-        token = generate_token()
-        expires_at = datetime.now() + timedelta(days=30)
+        if not user:
+            cursor.close()
+            return error_response(409, 'Пользователь с таким email уже существует')
         
-        cursor.execute(
-            "INSERT INTO sessions (user_id, token, expires_at) VALUES (%s, %s, %s)",
-            (user['id'], token, expires_at)
-        )
-        conn.commit()
+        credentials = credentials_response(user, token)
+        record_activity(user['id'], login=True)
         
         cursor.close()
-        conn.close()
         
-        return {
-            'statusCode': 201,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Регистрация успешна',
-                'token': token,
-                'user': {
-                    'id': user['id'],
-                    'email': user['email'],
-                    'full_name': user['full_name']
-                }
-            }),
-            'isBase64Encoded': False
-        }
+        return json_response(201, {
+            'message': 'Регистрация успешна',
+            **credentials,
+            'user': {
+                'id': user['id'],
+                'email': user['email'],
+                'full_name': user['full_name']
+            }
+        })
         
+    except PasswordHasherBusy:
+        return error_response(503, 'Сервер перегружен, повторите попытку', retry_after=1)
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'}),
-            'isBase64Encoded': False
-        }
+        return error_response(500, f'Ошибка сервера: {str(e)}')
+    finally:
+        if conn:
+            release_db_connection(conn)
 
 def login_user(event: dict) -> dict:
     '''Вход пользователя в систему'''
+    conn = None
     try:
         body = json.loads(event.get('body', '{}'))
         email = body.get('email', '').strip().lower()
         password = body.get('password', '')
         
         if not email or not password:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Email и пароль обязательны'}),
-                'isBase64Encoded': False
-            }
+            return error_response(400, 'Email и пароль обязательны')
+        
+        retry_after = check_throttle(throttle_limits(event, email))
+        if retry_after:
+            return error_response(429, 'Слишком много попыток, повторите позже', retry_after=retry_after)
         
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        password_hash = hash_password(password)
-        
         cursor.execute(
-            "SELECT id, email, full_name FROM users WHERE email = %s AND password_hash = %s",
-            (email, password_hash)
+            "SELECT id, email, full_name, password_hash FROM users WHERE email = %s",
+            (email,)
         )
         user = cursor.fetchone()
+        cursor.close()
+        # scrypt занимает десятки миллисекунд: соединение на это время возвращается в пул
+        release_db_connection(conn)
+        conn = None
         
-        if not user:
-            cursor.close()
-            conn.close()
-            return {
-                'statusCode': 401,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Неверный email или пароль'}),
-                'isBase64Encoded': False
-            }
+        stored_hash = user['password_hash'] if user and user['password_hash'] else DUMMY_PASSWORD_HASH
+        matches, needs_rehash = verify_password(password, stored_hash)
         
-        token = generate_token()
-        expires_at = datetime.now() + timedelta(days=30)
+        if not matches or stored_hash is DUMMY_PASSWORD_HASH:
+            return error_response(401, 'Неверный email или пароль')
         
-        cursor.execute(
-            "INSERT INTO sessions (user_id, token, expires_at) VALUES (%s, %s, %s)",
-            (user['id'], token, expires_at)
-        )
+        new_hash = hash_password(password) if needs_rehash else None
+        
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        if new_hash:
+            cursor.execute(
+                "UPDATE users SET password_hash = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+                (new_hash, user['id'])
+            )
+        
+        credentials = issue_credentials(cursor, user)
         conn.commit()
+        record_activity(user['id'], login=True)
         
         cursor.close()
-        conn.close()
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Вход успешен',
-                'token': token,
-                'user': {
-                    'id': user['id'],
-                    'email': user['email'],
-                    'full_name': user['full_name']
-                }
-            }),
-            'isBase64Encoded': False
-        }
+        return json_response(200, {
+            'message': 'Вход успешен',
+            **credentials,
+            'user': {
+                'id': user['id'],
+                'email': user['email'],
+                'full_name': user['full_name']
+            }
+        })
         
+    except PasswordHasherBusy:
+        return error_response(503, 'Сервер перегружен, повторите попытку', retry_after=1)
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'}),
-            'isBase64Encoded': False
-        }
+        return error_response(500, f'Ошибка сервера: {str(e)}')
+    finally:
+        if conn:
+            release_db_connection(conn)
 
 def verify_session(event: dict) -> dict:
     '''Проверка действительности токена сессии'''
+    conn = None
     try:
         auth_header = event.get('headers', {}).get('X-Authorization', '')
         token = auth_header.replace('Bearer ', '').strip()
         
         if not token:
-            return {
-                'statusCode': 401,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Токен не предоставлен'}),
-                'isBase64Encoded': False
+            return error_response(401, 'Токен не предоставлен')
+        
+        if uses_signed_tokens() and token.count('.') == 2:
+            payload = decode_access_token(token)
+            if not payload:
+                return error_response(401, 'Недействительный токен')
+            record_activity(payload['user_id'])
+            return json_response(200, {
+                'valid': True,
+                'user': {
+                    'id': payload['user_id'],
+                    'email': payload.get('email'),
+                    'full_name': payload.get('full_name') or (payload.get('profile') or {}).get('name')
+                }
+            })
+        
+        found, session = get_cached_session(token)
+        if not found:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            
+            execute_prepared(cursor, 'auth_verify_session', (hash_token(token),))
+            session = cursor.fetchone()
+            
+            cursor.close()
+            cache_session(token, session)
+        
+        if not session:
+            return error_response(401, 'Недействительный токен')
+        
+        if datetime.now() > session['expires_at']:
+            return error_response(401, 'Токен истёк')
+        
+        record_activity(session['user_id'])
+        return json_response(200, {
+            'valid': True,
+            'user': {
+                'id': session['user_id'],
+                'email': session['email'],
+                'full_name': session['full_name']
             }
+        })
+        
+    except Exception as e:
+        return error_response(500, f'Ошибка сервера: {str(e)}')
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+def refresh_access_token(event: dict) -> dict:
+    '''Выпуск нового access-токена по refresh-токену'''
+    conn = None
+    try:
+        body = json.loads(event.get('body', '{}'))
+        refresh_token = body.get('refresh_token', '')
+        
+        if not refresh_token:
+            return error_response(400, 'refresh_token обязателен')
         
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute(
-            '''SELECT s.user_id, s.expires_at, u.email, u.full_name 
-               FROM sessions s 
-               JOIN users u ON s.user_id = u.id 
-               WHERE s.token = %s''',
-            (token,)
-        )
-        session = cursor.fetchone()
+        execute_prepared(cursor, 'auth_refresh_user', (hash_token(refresh_token),))
+        user = cursor.fetchone()
         
         cursor.close()
-        conn.close()
         
-        if not session:
-            return {
-                'statusCode': 401,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Недействительный токен'}),
-                'isBase64Encoded': False
-            }
+        if not user:
+            return error_response(401, 'Недействительный refresh-токен')
         
-        if datetime.now() > session['expires_at']:
-            return {
-                'statusCode': 401,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Токен истёк'}),
-                'isBase64Encoded': False
+        record_activity(user['id'])
+        return json_response(200, {
+            'token': create_access_token(user),
+            'expires_in': ACCESS_TOKEN_TTL,
+            'user': {
+                'id': user['id'],
+                'email': user['email'],
+                'full_name': user['full_name']
             }
+        })
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'valid': True,
-                'user': {
-                    'id': session['user_id'],
-                    'email': session['email'],
-                    'full_name': session['full_name']
-                }
-            }),
-            'isBase64Encoded': False
-        }
+    except Exception as e:
+        return error_response(500, f'Ошибка сервера: {str(e)}')
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+def logout_user(event: dict) -> dict:
+    '''Выход: отзывает access-токен, удаляет сессию и refresh-токен'''
+    conn = None
+    try:
+        body = json.loads(event.get('body') or '{}')
+        refresh_token = body.get('refresh_token', '')
+        auth_header = event.get('headers', {}).get('X-Authorization', '')
+        token = auth_header.replace('Bearer ', '').strip()
+        
+        if token:
+            invalidate_cached_session(token)
+            if uses_signed_tokens() and token.count('.') == 2:
+                payload = decode_access_token(token)
+                if payload:
+                    revoke_access_token(payload)
+                token = ''
+        
+        if token or refresh_token:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            if token:
+                cursor.execute(
+                    '''DELETE FROM sessions WHERE token_hash = %s
+                       AND expires_at > NOW() AND expires_at <= NOW() + make_interval(days => %s)''',
+                    (hash_token(token), SESSION_TOKEN_DAYS + 1)
+                )
+            if refresh_token:
+                cursor.execute(
+                    '''DELETE FROM refresh_tokens WHERE token_hash = %s
+                       AND expires_at > NOW() AND expires_at <= NOW() + make_interval(days => %s)''',
+                    (hash_token(refresh_token), REFRESH_TOKEN_DAYS + 1)
+                )
+            conn.commit()
+            cursor.close()
         
+        return json_response(200, {'success': True})
+        
+    except Exception as e:
+        return error_response(500, f'Ошибка сервера: {str(e)}')
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+def _partition_name(table: str, week: date) -> str:
+    return f'{table}_p{week:%Y%m%d}'
+
+def list_partitions(cursor, table: str) -> dict:
+    '''Недельные секции таблицы: понедельник недели -> имя секции (DEFAULT не входит)'''
+    cursor.execute(
+        '''SELECT c.relname FROM pg_inherits i
+           JOIN pg_class c ON c.oid = i.inhrelid
+           WHERE i.inhparent = %s::regclass''',
+        (table,)
+    )
+    partitions = {}
+    prefix = f'{table}_p'
+    for row in cursor.fetchall():
+        suffix = row['relname'][len(prefix):]
+        if row['relname'].startswith(prefix) and len(suffix) == 8 and suffix.isdigit():
+            partitions[datetime.strptime(suffix, '%Y%m%d').date()] = row['relname']
+    return partitions
+
+def create_partition(cursor, table: str, week: date) -> str:
+    '''Создаёт секцию на неделю; строки этой недели, успевшие попасть в DEFAULT, переносятся в неё'''
+    name = _partition_name(table, week)
+    bounds = (week.isoformat(), (week + timedelta(days=7)).isoformat())
+    cursor.execute('SET LOCAL lock_timeout = %s', (PARTITION_LOCK_TIMEOUT,))
+    cursor.execute(
+        f'SELECT EXISTS (SELECT 1 FROM {table}_default WHERE expires_at >= %s AND expires_at < %s) AS present',
+        bounds
+    )
+    if cursor.fetchone()['present']:
+        # Без INCLUDING CONSTRAINTS ATTACH отклонит таблицу: у секции должны быть все CHECK родителя
+        cursor.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'''WITH moved AS (
+                   DELETE FROM {table}_default WHERE expires_at >= %s AND expires_at < %s RETURNING *
+               )
+               INSERT INTO {name} SELECT * FROM moved''',
+            bounds
+        )
+        cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', bounds)
+    else:
+        cursor.execute(f'CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)', bounds)
+    return name
+
+def drop_partition(cursor, name: str) -> str:
+    '''Удаляет секцию целиком: операция над метаданными вместо DELETE и VACUUM'''
+    cursor.execute('SET LOCAL lock_timeout = %s', (PARTITION_LOCK_TIMEOUT,))
+    cursor.execute(f'DROP TABLE {name}')
+    return name
+
+def maintain_partitions(conn, weeks_ahead: int = PARTITION_WEEKS_AHEAD) -> dict:
+    '''Создаёт недостающие будущие секции и удаляет полностью истёкшие; каждый шаг — отдельная транзакция'''
+    now = datetime.now()
+    current_week = now.date() - timedelta(days=now.weekday())
+    result = {'created': [], 'dropped': [], 'default_purged': 0, 'errors': []}
+    
+    for table in PARTITIONED_TABLES:
+        cursor = conn.cursor()
+        try:
+            partitions = list_partitions(cursor, table)
+            conn.rollback()
+            
+            steps = []
+            for week, name in sorted(partitions.items()):
+                if datetime.combine(week + timedelta(days=7), datetime.min.time()) <= now:
+                    steps.append(('dropped', drop_partition, (cursor, name)))
+            for offset in range(weeks_ahead + 1):
+                week = current_week + timedelta(weeks=offset)
+                if week not in partitions:
+                    steps.append(('created', create_partition, (cursor, table, week)))
+            
+            for kind, step, args in steps:
+                try:
+                    name = step(*args)
+                    conn.commit()
+                    result[kind].append(name)
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    result['errors'].append({'table': table, 'step': kind, 'error': str(e).strip()})
+            
+            cursor.execute(f'DELETE FROM {table}_default WHERE expires_at < %s', (now,))
+            result['default_purged'] += cursor.rowcount
+            conn.commit()
+        finally:
+            cursor.close()
+    return result
+
+def run_maintenance(event: dict) -> dict:
+    '''POST ?action=maintenance — обслуживание секций и счётчиков попыток для планировщика, вне пути авторизации'''
+    # без CLEANUP_SECRET действие закрыто; сравнение за постоянное время
+    cleanup_secret = os.environ.get('CLEANUP_SECRET', '')
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    provided = headers.get('x-cleanup-secret', '')
+    if not cleanup_secret or not hmac.compare_digest(provided.encode(), cleanup_secret.encode()):
+        return error_response(401, 'Unauthorized')
+    
+    conn = None
+    try:
+        conn = get_db_connection()
+        result = maintain_partitions(conn)
+        result['throttle_purged'] = purge_throttle_counters(conn)
+        return json_response(500 if result['errors'] else 200, result)
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'}),
-            'isBase64Encoded': False
-        }
+        return error_response(500, f'Ошибка сервера: {str(e)}')
+    finally:
+        if conn:
+            release_db_connection(conn)
 
+if __name__ == '__main__':
+    # python index.py [целевое_время_мс] — калибровка scrypt на железе деплоя
+    # python index.py maintenance — создание будущих и удаление истёкших секций и счётчиков попыток
+    if len(sys.argv) > 1 and sys.argv[1] == 'maintenance':
+        conn = get_db_connection()
+        try:
+            result = maintain_partitions(conn)
+            result['throttle_purged'] = purge_throttle_counters(conn)
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+        finally:
+            release_db_connection(conn)
+    else:
+        print(json.dumps(calibrate_scrypt(float(sys.argv[1]) if len(sys.argv) > 1 else 100)))
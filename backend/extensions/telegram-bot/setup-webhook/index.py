@@ -2,9 +2,76 @@
 Настройка webhook для Telegram бота
 """
 
+import importlib
 import json
 import os
-import requests
+
+
+class LazyModule:
+    """Импортирует модуль при первом обращении к атрибуту, чтобы OPTIONS не платил за requests"""
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+requests = LazyModule('requests')
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FrozenHeaders(dict):
+    """Заголовки, собранные один раз при загрузке модуля и общие для всех ответов"""
+    
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('FrozenHeaders нельзя изменять, скопируйте через dict(...)')
+    
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+
+
+JSON_HEADERS = FrozenHeaders({
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+})
+OPTIONS_HEADERS = FrozenHeaders({
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type'
+})
+
+
+def _json_default(value):
+    return str(value)
+
+
+def dump_json(body) -> str:
+    if orjson is not None:
+        return orjson.dumps(
+            body,
+            default=_json_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        ).decode()
+    return json.dumps(body, default=_json_default)
+
+
+def json_response(status: int, body, headers: dict = JSON_HEADERS) -> dict:
+    return {'statusCode': status, 'headers': headers, 'body': dump_json(body), 'isBase64Encoded': False}
+
+
+def error_response(status: int, message: str, **extra) -> dict:
+    return json_response(status, {'error': message, **extra})
+
+
+def options_response() -> dict:
+    return {'statusCode': 200, 'headers': OPTIONS_HEADERS, 'body': '', 'isBase64Encoded': False}
 
 
 def handler(event: dict, context) -> dict:
@@ -19,37 +86,23 @@ def handler(event: dict, context) -> dict:
     
     # CORS для OPTIONS
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': ''
-        }
+        return options_response()
     
     action = event.get('queryStringParameters', {}).get('action', 'info')
     
     bot_token = os.environ.get('TELEGRAM_BOT_TOKEN')
+    api_url = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
     webhook_secret = os.environ.get('TELEGRAM_WEBHOOK_SECRET')
     
     if not bot_token:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'TELEGRAM_BOT_TOKEN не настроен'})
-        }
+        return error_response(400, 'TELEGRAM_BOT_TOKEN не настроен')
     
     # URL функции telegram-bot из func2url.json
     webhook_url = 'https://functions.poehali.dev/1dcf997f-a380-46d0-907b-6aaed3597270'
     
     if action == 'setup':
         # Установка webhook
-        url = f'https://api.telegram.org/bot{bot_token}/setWebhook'
+        url = f'{api_url}/bot{bot_token}/setWebhook'
         params = {
             'url': webhook_url,
             'allowed_updates': ['message'],
@@ -62,57 +115,29 @@ def handler(event: dict, context) -> dict:
         response = requests.post(url, json=params)
         result = response.json()
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'success': result.get('ok', False),
-                'description': result.get('description', ''),
-                'webhook_url': webhook_url
-            })
-        }
+        return json_response(200, {
+            'success': result.get('ok', False),
+            'description': result.get('description', ''),
+            'webhook_url': webhook_url
+        })
     
     elif action == 'info':
         # Информация о webhook
-        url = f'https://api.telegram.org/bot{bot_token}/getWebhookInfo'
+        url = f'{api_url}/bot{bot_token}/getWebhookInfo'
         response = requests.get(url)
         result = response.json()
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps(result.get('result', {}))
-        }
+        return json_response(200, result.get('result', {}))
     
     elif action == 'delete':
         # Удаление webhook
-        url = f'https://api.telegram.org/bot{bot_token}/deleteWebhook'
+        url = f'{api_url}/bot{bot_token}/deleteWebhook'
         response = requests.post(url, json={'drop_pending_updates': True})
         result = response.json()
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'success': result.get('ok', False),
-                'description': result.get('description', '')
-            })
-        }
+        return json_response(200, {
+            'success': result.get('ok', False),
+            'description': result.get('description', '')
+        })
     
-    return {
-        'statusCode': 400,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': json.dumps({'error': 'Неизвестное действие. Используйте: setup, info, delete'})
-    }
+    return error_response(400, 'Неизвестное действие. Используйте: setup, info, delete')
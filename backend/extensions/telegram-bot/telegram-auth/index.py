@@ -12,19 +12,86 @@ Flow:
 import json
 import os
 import hashlib
+import hmac
+import importlib
 import secrets
+import threading
+import time
 from datetime import datetime, timezone, timedelta
 from typing import Optional
-import psycopg2
-import jwt
+
+
+class LazyModule:
+    """
+    Imports the wrapped module on first attribute access, so cold starts and
+    OPTIONS preflights do not pay for heavy dependencies they never use.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+psycopg2 = LazyModule("psycopg2")
+jwt = LazyModule("jwt")
 
 
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
 
-def get_db_connection():
-    return psycopg2.connect(os.environ["DATABASE_URL"])
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", "4"))
+DB_POOL_WAIT_TIMEOUT = float(os.environ.get("DB_POOL_WAIT_TIMEOUT", "5"))
+DB_POOL_CHECK_AFTER = float(os.environ.get("DB_POOL_CHECK_AFTER", "30"))
+
+# Embed name/avatar/telegram_id in access tokens so consumers skip the users query
+JWT_PROFILE_CLAIMS = os.environ.get("JWT_PROFILE_CLAIMS", "false").lower() in ("1", "true", "yes")
+PROFILE_CLAIMS_VERSION = 1
+
+# AIMD admission control: the in-flight limit grows by 1/limit per fast SQL statement and
+# shrinks by ADMISSION_BACKOFF when both the statement and smoothed latency exceed the
+# target or the pool runs dry. Low-priority work is shed first
+ADMISSION_MIN_LIMIT = int(os.environ.get("ADMISSION_MIN_LIMIT", "2"))
+ADMISSION_MAX_LIMIT = int(os.environ.get("ADMISSION_MAX_LIMIT", str(DB_POOL_MAX_SIZE * 4)))
+ADMISSION_LATENCY_TARGET = float(os.environ.get("ADMISSION_LATENCY_TARGET", "0.25"))
+ADMISSION_BACKOFF = 0.75
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", "2"))
+# Share of the limit each priority may use; callback and refresh are never shed
+ADMISSION_SHARES = {
+    "critical": None,
+    "normal": 1.0,
+    "low": float(os.environ.get("ADMISSION_LOW_PRIORITY_SHARE", "0.5")),
+}
+ACTION_PRIORITIES = {"callback": "critical", "refresh": "critical", "cleanup": "low"}
+
+REFRESH_TOKEN_DAYS = 30
+
+CLEANUP_BATCH_SIZE = int(os.environ.get("CLEANUP_BATCH_SIZE", "1000"))
+CLEANUP_MAX_BATCHES = int(os.environ.get("CLEANUP_MAX_BATCHES", "50"))
+
+# Hot lookups are parsed and planned once per pooled connection, then EXECUTEd by name
+PREPARED_STATEMENTS = {
+    # refresh_tokens is partitioned by expires_at; the live window lets the planner prune
+    # past and far-future weekly partitions (one day of slack for clock skew)
+    "tg_refresh_user": f"""
+        SELECT u.id, u.email, u.full_name, u.avatar_url, u.telegram_id
+        FROM {{schema}}refresh_tokens r
+        JOIN {{schema}}users u ON u.id = r.user_id
+        WHERE r.token_hash = $1
+          AND r.expires_at > NOW() AND r.expires_at <= NOW() + make_interval(days => {REFRESH_TOKEN_DAYS + 1})
+    """,
+    "tg_auth_token": """
+        SELECT telegram_id, telegram_username, telegram_first_name,
+               telegram_last_name, telegram_photo_url, expires_at, used
+        FROM {schema}telegram_auth_tokens
+        WHERE token_hash = $1
+    """,
+}
 
 
 def get_schema() -> str:
@@ -40,24 +107,238 @@ def get_env(key: str) -> str:
     return value
 
 
+# =============================================================================
+# CONNECTION POOL
+# =============================================================================
+
+# Module-level state survives warm invocations of the function instance.
+_db_pool = []
+_db_pool_cond = threading.Condition()
+_db_pool_stats = {"hits": 0, "misses": 0, "open": 0, "discarded": 0, "prepared": 0}
+# id(conn) -> names already PREPAREd on that connection; dropped with the connection
+_prepared_by_conn = {}
+# Cursor class that times statements, built on the first connection
+_timed_cursor_class = None
+
+
+def timed_cursor_class():
+    """Cursor that reports each statement's execution time to admission control."""
+    global _timed_cursor_class
+    if _timed_cursor_class is None:
+        class TimedCursor(psycopg2.extensions.cursor):
+            def execute(self, query, vars=None):
+                started = time.monotonic()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    observe_db_latency(time.monotonic() - started)
+        _timed_cursor_class = TimedCursor
+    return _timed_cursor_class
+
+
+def _open_db_connection():
+    return psycopg2.connect(os.environ["DATABASE_URL"], cursor_factory=timed_cursor_class())
+
+
+def _is_connection_healthy(conn, idle_since: float) -> bool:
+    """Ping connections that sat idle long enough to be dropped by the server."""
+    if conn.closed:
+        return False
+    if time.monotonic() - idle_since < DB_POOL_CHECK_AFTER:
+        return True
+    try:
+        # Ping in autocommit so it never opens a transaction that needs rolling back
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        finally:
+            conn.autocommit = False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _discard_db_connection(conn) -> None:
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+    with _db_pool_cond:
+        _prepared_by_conn.pop(id(conn), None)
+        _db_pool_stats["open"] -= 1
+        _db_pool_stats["discarded"] += 1
+        _db_pool_cond.notify()
+
+
+def get_db_connection():
+    """Take a healthy idle connection or open a new one while under the cap."""
+    try:
+        return _checkout_db_connection()
+    except psycopg2.OperationalError:
+        observe_db_latency(None)
+        raise
+
+
+def _checkout_db_connection():
+    deadline = time.monotonic() + DB_POOL_WAIT_TIMEOUT
+    while True:
+        with _db_pool_cond:
+            while not _db_pool and _db_pool_stats["open"] >= DB_POOL_MAX_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise psycopg2.OperationalError("Connection pool exhausted")
+                _db_pool_cond.wait(remaining)
+            if not _db_pool:
+                _db_pool_stats["open"] += 1
+                _db_pool_stats["misses"] += 1
+                break
+            conn, idle_since = _db_pool.pop()
+        if _is_connection_healthy(conn, idle_since):
+            with _db_pool_cond:
+                _db_pool_stats["hits"] += 1
+            return conn
+        _discard_db_connection(conn)
+
+    try:
+        return _open_db_connection()
+    except Exception:
+        with _db_pool_cond:
+            _db_pool_stats["open"] -= 1
+            _db_pool_cond.notify()
+        raise
+
+
+def release_db_connection(conn) -> None:
+    """Return connection to the pool, rolling back any open transaction."""
+    if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+    if conn.closed or conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        _discard_db_connection(conn)
+        return
+    with _db_pool_cond:
+        _db_pool.append((conn, time.monotonic()))
+        _db_pool_cond.notify()
+
+
+def get_pool_stats() -> dict:
+    with _db_pool_cond:
+        return {**_db_pool_stats, "idle": len(_db_pool), "max_size": DB_POOL_MAX_SIZE}
+
+
+def execute_prepared(cursor, name: str, params: tuple) -> None:
+    """
+    EXECUTE a statement from PREPARED_STATEMENTS, issuing PREPARE the first
+    time it is used on this connection.
+    """
+    conn = cursor.connection
+    with _db_pool_cond:
+        prepared = _prepared_by_conn.setdefault(id(conn), set())
+    fresh_transaction = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    if name not in prepared:
+        _prepare_statement(cursor, name, prepared)
+    execute = f"EXECUTE {name}({', '.join(['%s'] * len(params))})"
+    try:
+        cursor.execute(execute, params)
+    except psycopg2.Error as e:
+        # 26000: the server lost the statement (recycled backend, DISCARD ALL in a pooler)
+        if e.pgcode != "26000":
+            raise
+        prepared.clear()
+        if not fresh_transaction:
+            raise
+        conn.rollback()
+        _prepare_statement(cursor, name, prepared)
+        cursor.execute(execute, params)
+
+
+def _prepare_statement(cursor, name: str, prepared: set) -> None:
+    cursor.execute(f"PREPARE {name} AS " + PREPARED_STATEMENTS[name].format(schema=get_schema()))
+    prepared.add(name)
+    with _db_pool_cond:
+        _db_pool_stats["prepared"] += 1
+
+
+# =============================================================================
+# ADMISSION CONTROL
+# =============================================================================
+
+_admission = {"limit": float(ADMISSION_MAX_LIMIT), "inflight": 0, "latency": 0.0, "decreased_at": 0.0, "shed": 0}
+_admission_lock = threading.Lock()
+
+
+def admit(priority: str) -> bool:
+    """Admit while in-flight work is below this priority's share of the limit."""
+    share = ADMISSION_SHARES[priority]
+    with _admission_lock:
+        if share is not None and _admission["inflight"] >= _admission["limit"] * share:
+            _admission["shed"] += 1
+            return False
+        _admission["inflight"] += 1
+        return True
+
+
+def release_admission() -> None:
+    with _admission_lock:
+        _admission["inflight"] -= 1
+
+
+def observe_db_latency(seconds: Optional[float]) -> None:
+    """One AIMD step from a statement's execution time; None means no connection was had."""
+    now = time.monotonic()
+    with _admission_lock:
+        slow = seconds is None or seconds > ADMISSION_LATENCY_TARGET
+        if seconds is not None:
+            # a single long statement (bulk insert, maintenance) must not pin the average above target
+            seconds = min(seconds, ADMISSION_LATENCY_TARGET * 4)
+            previous = _admission["latency"]
+            _admission["latency"] = seconds if not previous else previous * 0.8 + seconds * 0.2
+        # only a slow statement on top of a slow average shrinks the limit, once per target interval
+        if slow and (seconds is None or _admission["latency"] > ADMISSION_LATENCY_TARGET):
+            if now - _admission["decreased_at"] >= ADMISSION_LATENCY_TARGET:
+                _admission["limit"] = max(ADMISSION_MIN_LIMIT, _admission["limit"] * ADMISSION_BACKOFF)
+                _admission["decreased_at"] = now
+        elif not slow:
+            _admission["limit"] = min(ADMISSION_MAX_LIMIT, _admission["limit"] + 1 / _admission["limit"])
+
+
+def get_admission_stats() -> dict:
+    with _admission_lock:
+        return {**_admission, "limit": round(_admission["limit"], 2)}
+
+
 # =============================================================================
 # SECURITY HELPERS
 # =============================================================================
 
-def hash_token(token: str) -> str:
-    return hashlib.sha256(token.encode()).hexdigest()
+def hash_token(token: str) -> bytes:
+    """32-byte SHA-256 digest, the BYTEA key tokens are stored under."""
+    return hashlib.sha256(token.encode()).digest()
 
 
 def generate_token(length: int = 32) -> str:
     return secrets.token_urlsafe(length)
 
 
-def create_jwt(user_id: int, secret: str, expires_in: int = 900) -> str:
+def create_jwt(user_id: int, secret: str, expires_in: int = 900, user: Optional[dict] = None) -> str:
     payload = {
         "user_id": user_id,
         "exp": datetime.now(timezone.utc) + timedelta(seconds=expires_in),
         "iat": datetime.now(timezone.utc),
     }
+    if user and JWT_PROFILE_CLAIMS:
+        # Versioned so consumers can tell which profile fields to expect
+        payload["profile"] = {
+            "v": PROFILE_CLAIMS_VERSION,
+            "name": user.get("name"),
+            "avatar_url": user.get("avatar_url"),
+            "telegram_id": user.get("telegram_id"),
+        }
     return jwt.encode(payload, secret, algorithm="HS256")
 
 
@@ -67,15 +348,7 @@ def create_jwt(user_id: int, secret: str, expires_in: int = 900) -> str:
 
 def get_auth_token(cursor, token: str) -> Optional[dict]:
     """Get auth token data by token."""
-    token_hash = hash_token(token)
-    schema = get_schema()
-
-    cursor.execute(f"""
-        SELECT telegram_id, telegram_username, telegram_first_name,
-               telegram_last_name, telegram_photo_url, expires_at, used
-        FROM {schema}telegram_auth_tokens
-        WHERE token_hash = %s
-    """, (token_hash,))
+    execute_prepared(cursor, "tg_auth_token", (hash_token(token),))
 
     row = cursor.fetchone()
     if not row:
@@ -92,94 +365,63 @@ def get_auth_token(cursor, token: str) -> Optional[dict]:
     }
 
 
-def mark_token_used(cursor, token: str) -> bool:
-    """Mark token as used."""
-    token_hash = hash_token(token)
-    schema = get_schema()
-
-    cursor.execute(f"""
-        UPDATE {schema}telegram_auth_tokens
-        SET used = TRUE
-        WHERE token_hash = %s AND used = FALSE
-        RETURNING id
-    """, (token_hash,))
-
-    return cursor.fetchone() is not None
-
-
-def cleanup_expired_tokens(cursor) -> None:
-    """Remove expired auth tokens."""
+def cleanup_expired_tokens(cursor, limit: int) -> int:
+    """Remove up to `limit` expired auth tokens, return rows deleted."""
     schema = get_schema()
     cursor.execute(f"""
         DELETE FROM {schema}telegram_auth_tokens
-        WHERE expires_at < NOW() OR (used = TRUE AND created_at < NOW() - INTERVAL '1 hour')
-    """)
+        WHERE id IN (
+            SELECT id FROM {schema}telegram_auth_tokens
+            WHERE expires_at < NOW() OR (used = TRUE AND created_at < NOW() - INTERVAL '1 hour')
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+    """, (limit,))
+    return cursor.rowcount
 
 
-def find_user_by_telegram_id(cursor, telegram_id: str) -> Optional[dict]:
-    """Find user by Telegram ID."""
+def exchange_auth_token(cursor, token: str, refresh_token_hash: bytes, refresh_expires: datetime) -> Optional[dict]:
+    """
+    Consume auth token, upsert user and store refresh token in one statement.
+    The UPDATE ... WHERE used = FALSE makes concurrent callbacks with the same
+    token race on the row lock, so only one of them gets a user back.
+    """
     schema = get_schema()
     cursor.execute(f"""
-        SELECT id, email, full_name, avatar_url, telegram_id
-        FROM {schema}users
-        WHERE telegram_id = %s
-    """, (telegram_id,))
-
-    row = cursor.fetchone()
-    if row:
-        return {
-            "id": row[0],
-            "email": row[1],
-            "name": row[2],
-            "avatar_url": row[3],
-            "telegram_id": row[4],
-        }
-    return None
-
-
-def create_or_update_user(
-    cursor,
-    telegram_id: str,
-    username: Optional[str],
-    first_name: Optional[str],
-    last_name: Optional[str],
-    photo_url: Optional[str]
-) -> dict:
-    """Create new user or update existing one."""
-    schema = get_schema()
-
-    # Build display name
-    name_parts = []
-    if first_name:
-        name_parts.append(first_name)
-    if last_name:
-        name_parts.append(last_name)
-    display_name = " ".join(name_parts) if name_parts else username or f"User {telegram_id}"
-
-    # Check if user exists
-    existing = find_user_by_telegram_id(cursor, telegram_id)
-
-    if existing:
-        # Update existing user
-        cursor.execute(f"""
-            UPDATE {schema}users
-            SET full_name = COALESCE(%s, full_name),
-                avatar_url = COALESCE(%s, avatar_url),
+        WITH consumed AS (
+            UPDATE {schema}telegram_auth_tokens
+            SET used = TRUE
+            WHERE token_hash = %s AND used = FALSE AND expires_at > NOW()
+            RETURNING telegram_id, telegram_username, telegram_first_name,
+                      telegram_last_name, telegram_photo_url
+        ), upserted AS (
+            INSERT INTO {schema}users (telegram_id, full_name, email, avatar_url, email_verified,
+                                       password_hash, created_at, updated_at, last_login_at)
+            SELECT telegram_id,
+                   COALESCE(
+                       NULLIF(CONCAT_WS(' ', NULLIF(telegram_first_name, ''), NULLIF(telegram_last_name, '')), ''),
+                       NULLIF(telegram_username, ''),
+                       'User ' || telegram_id
+                   ),
+                   'telegram_' || telegram_id || '@sparkom.app',
+                   telegram_photo_url, TRUE, '', NOW(), NOW(), NOW()
+            FROM consumed
+            ON CONFLICT (telegram_id) DO UPDATE
+            SET full_name = COALESCE(EXCLUDED.full_name, users.full_name),
+                avatar_url = COALESCE(EXCLUDED.avatar_url, users.avatar_url),
                 last_login_at = NOW(),
                 updated_at = NOW()
-            WHERE telegram_id = %s
-            RETURNING id, email, full_name, avatar_url, telegram_id
-        """, (display_name, photo_url, telegram_id))
-    else:
-        # Create new user
-        email_tg = f"telegram_{telegram_id}@sparkom.app"
-        cursor.execute(f"""
-            INSERT INTO {schema}users (telegram_id, full_name, email, avatar_url, email_verified, password_hash, created_at, updated_at, last_login_at)
-            VALUES (%s, %s, %s, %s, TRUE, '', NOW(), NOW(), NOW())
             RETURNING id, email, full_name, avatar_url, telegram_id
-        """, (telegram_id, display_name, email_tg, photo_url))
+        ), saved_refresh AS (
+            INSERT INTO {schema}refresh_tokens (user_id, token_hash, expires_at)
+            SELECT id, %s, %s FROM upserted
+        )
+        SELECT id, email, full_name, avatar_url, telegram_id FROM upserted
+    """, (hash_token(token), refresh_token_hash, refresh_expires))
 
     row = cursor.fetchone()
+    if not row:
+        return None
     return {
         "id": row[0],
         "email": row[1],
@@ -189,43 +431,9 @@ def create_or_update_user(
     }
 
 
-def save_refresh_token(cursor, user_id: int, token_hash: str, expires_at: datetime) -> None:
-    """Save hashed refresh token to DB."""
-    schema = get_schema()
-    cursor.execute(f"""
-        INSERT INTO {schema}refresh_tokens (user_id, token_hash, expires_at)
-        VALUES (%s, %s, %s)
-    """, (user_id, token_hash, expires_at))
-
-
-def find_refresh_token(cursor, token_hash: str) -> Optional[dict]:
-    """Find refresh token by hash."""
-    schema = get_schema()
-    cursor.execute(f"""
-        SELECT user_id, expires_at
-        FROM {schema}refresh_tokens
-        WHERE token_hash = %s AND expires_at > NOW()
-    """, (token_hash,))
-
-    row = cursor.fetchone()
-    if row:
-        return {"user_id": row[0], "expires_at": row[1]}
-    return None
-
-
-def delete_refresh_token(cursor, token_hash: str) -> None:
-    """Delete refresh token."""
-    schema = get_schema()
-    cursor.execute(f"DELETE FROM {schema}refresh_tokens WHERE token_hash = %s", (token_hash,))
-
-
-def get_user_by_id(cursor, user_id: int) -> Optional[dict]:
-    """Get user by ID."""
-    schema = get_schema()
-    cursor.execute(f"""
-        SELECT id, email, full_name, avatar_url, telegram_id
-        FROM {schema}users WHERE id = %s
-    """, (user_id,))
+def find_user_by_refresh_token(cursor, token_hash: bytes) -> Optional[dict]:
+    """Find the owner of a live refresh token with one indexed join."""
+    execute_prepared(cursor, "tg_refresh_user", (token_hash,))
 
     row = cursor.fetchone()
     if row:
@@ -239,38 +447,96 @@ def get_user_by_id(cursor, user_id: int) -> Optional[dict]:
     return None
 
 
-def cleanup_expired_refresh_tokens(cursor) -> None:
-    """Remove expired refresh tokens."""
+def delete_refresh_token(cursor, token_hash: bytes) -> None:
+    """Delete refresh token."""
+    schema = get_schema()
+    cursor.execute(f"""
+        DELETE FROM {schema}refresh_tokens
+        WHERE token_hash = %s AND expires_at > NOW() AND expires_at <= NOW() + make_interval(days => %s)
+    """, (token_hash, REFRESH_TOKEN_DAYS + 1))
+
+
+def cleanup_expired_refresh_tokens(cursor, limit: int) -> int:
+    """Remove up to `limit` expired refresh tokens, return rows deleted."""
     schema = get_schema()
-    cursor.execute(f"DELETE FROM {schema}refresh_tokens WHERE expires_at < NOW()")
+    cursor.execute(f"""
+        DELETE FROM {schema}refresh_tokens
+        WHERE id IN (
+            SELECT id FROM {schema}refresh_tokens
+            WHERE expires_at < NOW()
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+    """, (limit,))
+    return cursor.rowcount
 
 
 # =============================================================================
-# CORS HELPERS
+# RESPONSES
 # =============================================================================
 
-def get_cors_headers() -> dict:
-    allowed_origins = os.environ.get("ALLOWED_ORIGINS", "*")
-    return {
-        "Access-Control-Allow-Origin": allowed_origins,
-        "Access-Control-Allow-Methods": "POST, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type",
-    }
+try:
+    import orjson
+except ImportError:  # stdlib json fallback
+    orjson = None
+
+
+class FrozenHeaders(dict):
+    """Header map built once at import and shared by every response."""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("FrozenHeaders is read-only, copy it with dict(...)")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+
+
+CORS_HEADERS = FrozenHeaders({
+    "Access-Control-Allow-Origin": os.environ.get("ALLOWED_ORIGINS", "*"),
+    "Access-Control-Allow-Methods": "POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type",
+})
+JSON_HEADERS = FrozenHeaders({**CORS_HEADERS, "Content-Type": "application/json"})
+OVERLOADED_HEADERS = FrozenHeaders({**JSON_HEADERS, "Retry-After": str(ADMISSION_RETRY_AFTER)})
 
 
-def cors_response(status: int, body: dict) -> dict:
+def _json_default(value):
+    return str(value)
+
+
+def dump_json(body) -> str:
+    if orjson is not None:
+        return orjson.dumps(
+            body,
+            default=_json_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        ).decode()
+    return json.dumps(body, default=_json_default)
+
+
+def json_response(status: int, body, headers: dict = JSON_HEADERS) -> dict:
     return {
         "statusCode": status,
-        "headers": {**get_cors_headers(), "Content-Type": "application/json"},
-        "body": json.dumps(body),
+        "headers": headers,
+        "body": dump_json(body),
+        "isBase64Encoded": False,
     }
 
 
+def error_response(status: int, message: str, **extra) -> dict:
+    """Uniform error envelope: {"error": message, ...extra}."""
+    return json_response(status, {"error": message, **extra})
+
+
+def overloaded_response() -> dict:
+    return json_response(503, {"error": "Service overloaded, retry later"}, OVERLOADED_HEADERS)
+
+
 def options_response() -> dict:
     return {
         "statusCode": 204,
-        "headers": get_cors_headers(),
+        "headers": CORS_HEADERS,
         "body": "",
+        "isBase64Encoded": False,
     }
 
 
@@ -286,57 +552,31 @@ def handle_callback(cursor, body: dict) -> dict:
     """
     token = body.get("token")
     if not token:
-        return cors_response(400, {"error": "Missing token"})
-
-    token_data = get_auth_token(cursor, token)
+        return error_response(400, "Missing token")
 
-    if not token_data:
-        return cors_response(404, {"error": "Token not found"})
-
-    # Check if expired (handle both naive and aware datetime from DB)
-    expires_at = token_data["expires_at"]
-    now = datetime.now(timezone.utc)
-    # Convert to naive UTC for comparison if needed
-    if expires_at.tzinfo is None:
-        expires_at = expires_at.replace(tzinfo=timezone.utc)
-    if expires_at < now:
-        return cors_response(410, {"error": "Token expired"})
-
-    # Check if already used
-    if token_data["used"]:
-        return cors_response(410, {"error": "Token already used"})
-
-    # Check if user data exists
-    if not token_data["telegram_id"]:
-        return cors_response(400, {"error": "Token not authenticated"})
-
-    # Get JWT secret
+    # Get JWT secret before the token is consumed
     jwt_secret = get_env("JWT_SECRET")
     if len(jwt_secret) < 32:
-        return cors_response(500, {"error": "Server configuration error"})
-
-    # Create or update user
-    user = create_or_update_user(
-        cursor,
-        telegram_id=token_data["telegram_id"],
-        username=token_data["telegram_username"],
-        first_name=token_data["telegram_first_name"],
-        last_name=token_data["telegram_last_name"],
-        photo_url=token_data["telegram_photo_url"],
-    )
-
-    # Mark token as used
-    mark_token_used(cursor, token)
-
-    # Generate tokens
-    access_token = create_jwt(user["id"], jwt_secret)
+        return error_response(500, "Server configuration error")
+
     refresh_token = generate_token(48)
     refresh_token_hash = hash_token(refresh_token)
-    refresh_expires = datetime.now(timezone.utc) + timedelta(days=30)
+    refresh_expires = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_DAYS)
 
-    save_refresh_token(cursor, user["id"], refresh_token_hash, refresh_expires)
+    user = exchange_auth_token(cursor, token, refresh_token_hash, refresh_expires)
 
-    return cors_response(200, {
+    if not user:
+        # Slow path: explain why the exchange did not happen
+        token_data = get_auth_token(cursor, token)
+        if not token_data:
+            return error_response(404, "Token not found")
+        if token_data["used"]:
+            return error_response(410, "Token already used")
+        return error_response(410, "Token expired")
+
+    access_token = create_jwt(user["id"], jwt_secret, user=user)
+
+    return json_response(200, {
         "access_token": access_token,
         "refresh_token": refresh_token,
         "expires_in": 900,
@@ -351,23 +591,19 @@ def handle_refresh(cursor, body: dict) -> dict:
     """
     refresh_token = body.get("refresh_token")
     if not refresh_token:
-        return cors_response(400, {"error": "Missing refresh_token"})
+        return error_response(400, "Missing refresh_token")
 
     jwt_secret = get_env("JWT_SECRET")
     token_hash = hash_token(refresh_token)
 
-    token_data = find_refresh_token(cursor, token_hash)
-    if not token_data:
-        return cors_response(401, {"error": "Invalid or expired refresh token"})
-
-    user = get_user_by_id(cursor, token_data["user_id"])
+    user = find_user_by_refresh_token(cursor, token_hash)
     if not user:
-        return cors_response(401, {"error": "User not found"})
+        return error_response(401, "Invalid or expired refresh token")
 
     # Generate new access token
-    access_token = create_jwt(user["id"], jwt_secret)
+    access_token = create_jwt(user["id"], jwt_secret, user=user)
 
-    return cors_response(200, {
+    return json_response(200, {
         "access_token": access_token,
         "expires_in": 900,
         "user": user,
@@ -384,7 +620,51 @@ def handle_logout(cursor, body: dict) -> dict:
         token_hash = hash_token(refresh_token)
         delete_refresh_token(cursor, token_hash)
 
-    return cors_response(200, {"success": True})
+    return json_response(200, {"success": True})
+
+
+def run_cleanup(conn, batch_size: int = CLEANUP_BATCH_SIZE, max_batches: int = CLEANUP_MAX_BATCHES) -> dict:
+    """
+    Purge expired tokens in short transactions of at most `batch_size` rows
+    so the reaper never holds long locks against interactive requests.
+    Each table gets its own `max_batches` budget, so a backlog of auth
+    tokens cannot starve the refresh tokens.
+    """
+    purged = {"auth_tokens": 0, "refresh_tokens": 0}
+    batches = {"auth_tokens": 0, "refresh_tokens": 0}
+    complete = True
+    cursor = conn.cursor()
+    for key, cleanup in (
+        ("auth_tokens", cleanup_expired_tokens),
+        ("refresh_tokens", cleanup_expired_refresh_tokens),
+    ):
+        while True:
+            if batches[key] >= max_batches:
+                complete = False
+                break
+            deleted = cleanup(cursor, batch_size)
+            conn.commit()
+            batches[key] += 1
+            purged[key] += deleted
+            if deleted < batch_size:
+                break
+    cursor.close()
+    return {"purged": purged, "batches": batches, "complete": complete}
+
+
+def handle_cleanup(conn, event: dict) -> dict:
+    """
+    POST ?action=cleanup
+    Reaper entry point for a scheduled trigger; never runs on the login path.
+    """
+    # Closed unless CLEANUP_SECRET is set; constant-time comparison
+    cleanup_secret = os.environ.get("CLEANUP_SECRET", "")
+    headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+    provided = headers.get("x-cleanup-secret", "")
+    if not cleanup_secret or not hmac.compare_digest(provided.encode(), cleanup_secret.encode()):
+        return error_response(401, "Unauthorized")
+
+    return json_response(200, run_cleanup(conn))
 
 
 # =============================================================================
@@ -410,17 +690,16 @@ def handler(event, context):
         try:
             body = json.loads(raw_body) if raw_body else {}
         except json.JSONDecodeError:
-            return cors_response(400, {"error": "Invalid JSON"})
+            return error_response(400, "Invalid JSON")
+
+    if not admit(ACTION_PRIORITIES.get(action, "normal")):
+        return overloaded_response()
 
     conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # Cleanup expired tokens periodically
-        cleanup_expired_tokens(cursor)
-        cleanup_expired_refresh_tokens(cursor)
-
         # Route to action handler
         if action == "callback" and method == "POST":
             response = handle_callback(cursor, body)
@@ -428,19 +707,22 @@ def handler(event, context):
             response = handle_refresh(cursor, body)
         elif action == "logout" and method == "POST":
             response = handle_logout(cursor, body)
+        elif action == "cleanup" and method == "POST":
+            response = handle_cleanup(conn, event)
         else:
-            response = cors_response(400, {"error": f"Unknown action: {action}"})
+            response = error_response(400, f"Unknown action: {action}")
 
         conn.commit()
         return response
 
     except ValueError as e:
-        return cors_response(500, {"error": "Server configuration error"})
+        return error_response(500, "Server configuration error")
     except Exception as e:
         if conn:
             conn.rollback()
         print(f"Error: {e}")
-        return cors_response(500, {"error": "Internal server error"})
+        return error_response(500, "Internal server error")
     finally:
         if conn:
-            conn.close()
\ No newline at end of file
+            release_db_connection(conn)
+        release_admission()
\ No newline at end of file
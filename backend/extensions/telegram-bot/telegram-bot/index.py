@@ -3,19 +3,45 @@ Telegram Bot Function
 
 Обрабатывает:
 1. Webhook от Telegram для авторизации через /start web_auth
-2. Отправку уведомлений через API (action=send, action=send-photo)
+2. Отправку уведомлений через API (action=send, action=send-photo, action=send-batch)
 3. Тестовые сообщения (action=test)
+4. Очередь уведомлений (queue=true в send/send-photo, action=drain-outbox для воркеров)
+5. Обработку update из webhook воркером (action=process-updates)
 """
 
 import json
 import os
 import uuid
 import hashlib
+import hmac
+import importlib
+import threading
+import time
 from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
-import psycopg2
-import telebot
+
+class LazyModule:
+    """
+    Импортирует модуль при первом обращении к атрибуту, поэтому холодный старт
+    и preflight OPTIONS не платят за тяжёлые зависимости, которые им не нужны.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+psycopg2 = LazyModule("psycopg2")
+psycopg2_extras = LazyModule("psycopg2.extras")
+requests = LazyModule("requests")
+telebot = LazyModule("telebot")
 
 
 # =============================================================================
@@ -30,9 +56,76 @@ def get_bot_token() -> str:
     return token
 
 
-def get_bot() -> telebot.TeleBot:
-    """Create bot instance."""
-    return telebot.TeleBot(get_bot_token())
+TELEGRAM_CONNECT_TIMEOUT = float(os.environ.get("TELEGRAM_CONNECT_TIMEOUT", "3.05"))
+TELEGRAM_READ_TIMEOUT = float(os.environ.get("TELEGRAM_READ_TIMEOUT", "10"))
+TELEGRAM_HTTP_POOL_SIZE = int(os.environ.get("TELEGRAM_HTTP_POOL_SIZE", "8"))
+
+# Лимиты Bot API: ~30 сообщений в секунду на бота и ~1 в секунду на чат
+BATCH_GLOBAL_RATE = float(os.environ.get("BATCH_GLOBAL_RATE", "25"))
+BATCH_PER_CHAT_INTERVAL = float(os.environ.get("BATCH_PER_CHAT_INTERVAL", "1"))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_RECIPIENTS = int(os.environ.get("BATCH_MAX_RECIPIENTS", "500"))
+BATCH_MAX_RETRIES = int(os.environ.get("BATCH_MAX_RETRIES", "3"))
+
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "40"))
+OUTBOX_LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", "60"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_DRAIN_SECONDS = float(os.environ.get("OUTBOX_DRAIN_SECONDS", "20"))
+OUTBOX_BACKOFF_BASE = float(os.environ.get("OUTBOX_BACKOFF_BASE", "5"))
+OUTBOX_BACKOFF_MAX = float(os.environ.get("OUTBOX_BACKOFF_MAX", "3600"))
+# Отправку нужно начать так, чтобы она закончилась до конца аренды: иначе
+# параллельный воркер захватит запись повторно и отправит её ещё раз
+OUTBOX_SEND_WINDOW = OUTBOX_LEASE_SECONDS - TELEGRAM_CONNECT_TIMEOUT - TELEGRAM_READ_TIMEOUT
+# Пачка в один чат должна уложиться в окно при темпе BATCH_PER_CHAT_INTERVAL
+OUTBOX_MAX_BATCH_SIZE = max(1, int(OUTBOX_SEND_WINDOW / max(BATCH_PER_CHAT_INTERVAL, 1 / BATCH_GLOBAL_RATE)))
+
+UPDATES_BATCH_SIZE = int(os.environ.get("UPDATES_BATCH_SIZE", "20"))
+UPDATES_LEASE_SECONDS = int(os.environ.get("UPDATES_LEASE_SECONDS", "30"))
+UPDATES_MAX_ATTEMPTS = int(os.environ.get("UPDATES_MAX_ATTEMPTS", "5"))
+UPDATES_RETENTION_HOURS = int(os.environ.get("UPDATES_RETENTION_HOURS", "24"))
+# Воркер process-updates может дежурить до следующего срабатывания таймера,
+# разбирая новые update почти сразу после webhook
+UPDATES_POLL_INTERVAL = float(os.environ.get("UPDATES_POLL_INTERVAL", "0.5"))
+UPDATES_POLL_MAX_SECONDS = float(os.environ.get("UPDATES_POLL_MAX_SECONDS", "55"))
+
+
+def _create_http_session() -> "requests.Session":
+    """Keep-alive сессия: TLS-соединения с Bot API переживают тёплые вызовы."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=TELEGRAM_HTTP_POOL_SIZE, max_retries=0
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _configure_apihelper() -> None:
+    """Настраивает telebot при первом создании бота, а не при импорте модуля."""
+    # Позволяет направить бота на локальный фейковый Bot API (бенчмарки, тесты)
+    if os.environ.get("TELEGRAM_API_URL"):
+        telebot.apihelper.API_URL = os.environ["TELEGRAM_API_URL"].rstrip("/") + "/bot{0}/{1}"
+    # Общая сессия для всех потоков вместо per-thread сессий с TTL по умолчанию
+    telebot.apihelper.session = _create_http_session()
+    telebot.apihelper.SESSION_TIME_TO_LIVE = None
+    telebot.apihelper.CONNECT_TIMEOUT = TELEGRAM_CONNECT_TIMEOUT
+    telebot.apihelper.READ_TIMEOUT = TELEGRAM_READ_TIMEOUT
+
+
+_bot = None
+_bot_lock = threading.Lock()
+
+
+def get_bot() -> "telebot.TeleBot":
+    """Возвращает бота, закешированного на время жизни экземпляра функции."""
+    global _bot
+    token = get_bot_token()
+    with _bot_lock:
+        if _bot is None:
+            _configure_apihelper()
+        if _bot is None or _bot.token != token:
+            _bot = telebot.TeleBot(token, threaded=False)
+        return _bot
 
 
 def get_default_chat_id() -> str:
@@ -46,35 +139,277 @@ def get_schema() -> str:
     return f"{schema}." if schema else ""
 
 
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", "4"))
+DB_POOL_WAIT_TIMEOUT = float(os.environ.get("DB_POOL_WAIT_TIMEOUT", "5"))
+DB_POOL_CHECK_AFTER = float(os.environ.get("DB_POOL_CHECK_AFTER", "30"))
+
+# Контроль допуска (AIMD): лимит запросов в работе растёт на 1/лимит после каждого быстрого
+# SQL-запроса и умножается на ADMISSION_BACKOFF, когда запрос и сглаженная задержка выше цели
+# или пул исчерпан. Сверх лимита первыми отбрасываются запросы низкого приоритета
+ADMISSION_MIN_LIMIT = int(os.environ.get("ADMISSION_MIN_LIMIT", "2"))
+ADMISSION_MAX_LIMIT = int(os.environ.get("ADMISSION_MAX_LIMIT", str(DB_POOL_MAX_SIZE * 4)))
+ADMISSION_LATENCY_TARGET = float(os.environ.get("ADMISSION_LATENCY_TARGET", "0.25"))
+ADMISSION_BACKOFF = 0.75
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", "2"))
+# Доля лимита, доступная приоритету; webhook (вход через бота) не отбрасывается,
+# тестовые сообщения и воркеры очередей уступают место первыми
+ADMISSION_SHARES = {
+    "critical": None,
+    "normal": 1.0,
+    "low": float(os.environ.get("ADMISSION_LOW_PRIORITY_SHARE", "0.5")),
+}
+ACTION_PRIORITIES = {"": "critical", "test": "low", "drain-outbox": "low", "process-updates": "low"}
+
+
 # =============================================================================
-# CORS HELPERS
+# CONNECTION POOL
 # =============================================================================
 
-def get_cors_headers() -> dict:
-    allowed_origins = os.environ.get("ALLOWED_ORIGINS", "*")
-    return {
-        "Access-Control-Allow-Origin": allowed_origins,
-        "Access-Control-Allow-Methods": "POST, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, X-Telegram-Bot-Api-Secret-Token",
-    }
+# Состояние на уровне модуля переживает тёплые вызовы функции.
+_db_pool = []
+_db_pool_cond = threading.Condition()
+_db_pool_stats = {"hits": 0, "misses": 0, "open": 0, "discarded": 0}
+# Класс курсора с замером времени запросов создаётся при первом соединении
+_timed_cursor_class = None
+
+
+def timed_cursor_class():
+    """Курсор, который сообщает контролю допуска время выполнения каждого запроса"""
+    global _timed_cursor_class
+    if _timed_cursor_class is None:
+        class TimedCursor(psycopg2.extensions.cursor):
+            def execute(self, query, vars=None):
+                started = time.monotonic()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    observe_db_latency(time.monotonic() - started)
+        _timed_cursor_class = TimedCursor
+    return _timed_cursor_class
+
+
+def _open_db_connection():
+    return psycopg2.connect(os.environ["DATABASE_URL"], cursor_factory=timed_cursor_class())
+
+
+def _is_connection_healthy(conn, idle_since: float) -> bool:
+    """Пингует соединения, которые простаивали дольше DB_POOL_CHECK_AFTER."""
+    if conn.closed:
+        return False
+    if time.monotonic() - idle_since < DB_POOL_CHECK_AFTER:
+        return True
+    try:
+        # Пинг в autocommit не открывает транзакцию, и откатывать после него нечего
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        finally:
+            conn.autocommit = False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _discard_db_connection(conn) -> None:
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+    with _db_pool_cond:
+        _db_pool_stats["open"] -= 1
+        _db_pool_stats["discarded"] += 1
+        _db_pool_cond.notify()
+
+
+def get_db_connection():
+    """Берёт живое соединение из пула или открывает новое в пределах лимита."""
+    try:
+        return _checkout_db_connection()
+    except psycopg2.OperationalError:
+        observe_db_latency(None)
+        raise
+
+
+def _checkout_db_connection():
+    deadline = time.monotonic() + DB_POOL_WAIT_TIMEOUT
+    while True:
+        with _db_pool_cond:
+            while not _db_pool and _db_pool_stats["open"] >= DB_POOL_MAX_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise psycopg2.OperationalError("Connection pool exhausted")
+                _db_pool_cond.wait(remaining)
+            if not _db_pool:
+                _db_pool_stats["open"] += 1
+                _db_pool_stats["misses"] += 1
+                break
+            conn, idle_since = _db_pool.pop()
+        if _is_connection_healthy(conn, idle_since):
+            with _db_pool_cond:
+                _db_pool_stats["hits"] += 1
+            return conn
+        _discard_db_connection(conn)
+
+    try:
+        return _open_db_connection()
+    except Exception:
+        with _db_pool_cond:
+            _db_pool_stats["open"] -= 1
+            _db_pool_cond.notify()
+        raise
+
+
+def release_db_connection(conn) -> None:
+    """Возвращает соединение в пул, откатывая незавершённую транзакцию."""
+    if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+    if conn.closed or conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        _discard_db_connection(conn)
+        return
+    with _db_pool_cond:
+        _db_pool.append((conn, time.monotonic()))
+        _db_pool_cond.notify()
+
+
+def get_pool_stats() -> dict:
+    with _db_pool_cond:
+        return {**_db_pool_stats, "idle": len(_db_pool), "max_size": DB_POOL_MAX_SIZE}
+
+
+# =============================================================================
+# ADMISSION CONTROL
+# =============================================================================
+
+_admission = {"limit": float(ADMISSION_MAX_LIMIT), "inflight": 0, "latency": 0.0, "decreased_at": 0.0, "shed": 0}
+_admission_lock = threading.Lock()
+
+
+def admit(priority: str) -> bool:
+    """Пропускает запрос, пока запросов в работе меньше его доли лимита; критичные проходят всегда."""
+    share = ADMISSION_SHARES[priority]
+    with _admission_lock:
+        if share is not None and _admission["inflight"] >= _admission["limit"] * share:
+            _admission["shed"] += 1
+            return False
+        _admission["inflight"] += 1
+        return True
+
+
+def release_admission() -> None:
+    with _admission_lock:
+        _admission["inflight"] -= 1
+
+
+def observe_db_latency(seconds: Optional[float]) -> None:
+    """Шаг AIMD по времени выполнения запроса; None — соединение получить не удалось"""
+    now = time.monotonic()
+    with _admission_lock:
+        slow = seconds is None or seconds > ADMISSION_LATENCY_TARGET
+        if seconds is not None:
+            # Один долгий запрос (пакетная вставка, обслуживание) не должен держать среднее выше цели
+            seconds = min(seconds, ADMISSION_LATENCY_TARGET * 4)
+            previous = _admission["latency"]
+            _admission["latency"] = seconds if not previous else previous * 0.8 + seconds * 0.2
+        # Уменьшает лимит только медленный запрос при высокой средней, и не чаще раза за интервал цели
+        if slow and (seconds is None or _admission["latency"] > ADMISSION_LATENCY_TARGET):
+            if now - _admission["decreased_at"] >= ADMISSION_LATENCY_TARGET:
+                _admission["limit"] = max(ADMISSION_MIN_LIMIT, _admission["limit"] * ADMISSION_BACKOFF)
+                _admission["decreased_at"] = now
+        elif not slow:
+            _admission["limit"] = min(ADMISSION_MAX_LIMIT, _admission["limit"] + 1 / _admission["limit"])
+
+
+def get_admission_stats() -> dict:
+    with _admission_lock:
+        return {**_admission, "limit": round(_admission["limit"], 2)}
+
+
+# =============================================================================
+# RESPONSES
+# =============================================================================
+
+try:
+    import orjson
+except ImportError:  # запасной вариант на stdlib json
+    orjson = None
+
+
+class FrozenHeaders(dict):
+    """Словарь заголовков, собранный один раз при импорте и общий для всех ответов."""
 
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("FrozenHeaders is read-only, copy it with dict(...)")
 
-def cors_response(status: int, body: dict) -> dict:
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+
+
+CORS_HEADERS = FrozenHeaders({
+    "Access-Control-Allow-Origin": os.environ.get("ALLOWED_ORIGINS", "*"),
+    "Access-Control-Allow-Methods": "POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, X-Telegram-Bot-Api-Secret-Token",
+})
+JSON_HEADERS = FrozenHeaders({**CORS_HEADERS, "Content-Type": "application/json"})
+# Telegram вызывает webhook напрямую с сервера, CORS-заголовки там не нужны
+WEBHOOK_HEADERS = FrozenHeaders({"Content-Type": "application/json"})
+OVERLOADED_HEADERS = FrozenHeaders({**JSON_HEADERS, "Retry-After": str(ADMISSION_RETRY_AFTER)})
+
+
+def _json_default(value):
+    return str(value)
+
+
+def dump_json(body) -> str:
+    if orjson is not None:
+        return orjson.dumps(
+            body,
+            default=_json_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        ).decode()
+    return json.dumps(body, default=_json_default)
+
+
+def json_response(status: int, body, headers: dict = JSON_HEADERS) -> dict:
     return {
         "statusCode": status,
-        "headers": {**get_cors_headers(), "Content-Type": "application/json"},
-        "body": json.dumps(body),
+        "headers": headers,
+        "body": dump_json(body),
+        "isBase64Encoded": False,
     }
 
 
+def error_response(status: int, message: str, **extra) -> dict:
+    """Единый формат ошибки: {"error": message, ...extra}."""
+    return json_response(status, {"error": message, **extra})
+
+
+def overloaded_response() -> dict:
+    return json_response(503, {"error": "Service overloaded, retry later"}, OVERLOADED_HEADERS)
+
+
 def options_response() -> dict:
     return {
         "statusCode": 204,
-        "headers": get_cors_headers(),
+        "headers": CORS_HEADERS,
         "body": "",
+        "isBase64Encoded": False,
     }
 
 
+def is_worker_authorized(event: dict) -> bool:
+    """Проверяет X-Worker-Secret за постоянное время; без WORKER_SECRET действия воркеров закрыты."""
+    worker_secret = os.environ.get("WORKER_SECRET", "")
+    if not worker_secret:
+        return False
+    headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+    return hmac.compare_digest(headers.get("x-worker-secret", "").encode(), worker_secret.encode())
+
+
 # =============================================================================
 # DATABASE OPERATIONS
 # =============================================================================
@@ -87,10 +422,10 @@ def save_auth_token(
 ) -> str:
     """Сохраняет токен авторизации в БД и возвращает его."""
     token = str(uuid.uuid4())
-    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    token_hash = hashlib.sha256(token.encode()).digest()
     schema = get_schema()
 
-    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    conn = get_db_connection()
     try:
         cursor = conn.cursor()
         cursor.execute(f"""
@@ -109,7 +444,7 @@ def save_auth_token(
         ))
         conn.commit()
     finally:
-        conn.close()
+        release_db_connection(conn)
 
     return token
 
@@ -146,19 +481,19 @@ def handle_start(chat_id: int) -> None:
     bot.send_message(chat_id, "Привет! Используйте кнопку «Войти через Telegram» на сайте.")
 
 
-def process_webhook(body: dict) -> dict:
-    """Обработка webhook от Telegram."""
-    message = body.get("message")
+def handle_update(update: dict) -> None:
+    """Обработка одного update от Telegram из очереди telegram_updates."""
+    message = update.get("message")
 
     if not message:
-        return {"statusCode": 200, "body": json.dumps({"ok": True})}
+        return
 
     text = message.get("text", "")
     user = message.get("from", {})
     chat_id = message.get("chat", {}).get("id")
 
     if not chat_id:
-        return {"statusCode": 200, "body": json.dumps({"ok": True})}
+        return
 
     try:
         if text.startswith("/start"):
@@ -168,11 +503,190 @@ def process_webhook(body: dict) -> dict:
             else:
                 handle_start(chat_id)
     except telebot.apihelper.ApiTelegramException as e:
+        # 429 и 5xx временные: update возвращается в очередь с паузой
+        if _retry_after(e) is not None or e.error_code >= 500:
+            raise
         print(f"Telegram API error: {e}")
+
+
+def process_webhook(body: dict) -> dict:
+    """
+    Обработка webhook от Telegram: update сохраняется по update_id и сразу
+    подтверждается. Вызовы Bot API делает воркер process-updates, поэтому
+    время ответа webhook не зависит от скорости Telegram.
+    """
+    update_id = body.get("update_id")
+    if update_id is None:
+        return json_response(200, {"ok": True}, WEBHOOK_HEADERS)
+
+    try:
+        persist_update(update_id, body)
+    except Exception as e:
+        print(f"Error saving update {update_id}: {e}")
+        return json_response(500, {"ok": False}, WEBHOOK_HEADERS)
+
+    return json_response(200, {"ok": True}, WEBHOOK_HEADERS)
+
+
+# =============================================================================
+# UPDATE QUEUE
+# =============================================================================
+
+def persist_update(update_id: int, update: dict) -> bool:
+    """Сохраняет update; False, если такой update_id уже был получен."""
+    schema = get_schema()
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            INSERT INTO {schema}telegram_updates (update_id, payload)
+            VALUES (%s, %s)
+            ON CONFLICT (update_id) DO NOTHING
+            RETURNING update_id
+        """, (update_id, psycopg2_extras.Json(update)))
+        is_new = cursor.fetchone() is not None
+        conn.commit()
+        return is_new
+    finally:
+        release_db_connection(conn)
+
+
+def claim_updates(conn, limit: int) -> list:
+    """Захватывает готовые update с арендой, как и записи outbox."""
+    schema = get_schema()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        UPDATE {schema}telegram_updates AS u
+        SET status = 'processing',
+            attempts = u.attempts + 1,
+            next_attempt_at = NOW() + make_interval(secs => %s)
+        WHERE u.update_id IN (
+            SELECT update_id FROM {schema}telegram_updates
+            WHERE status IN ('pending', 'processing') AND next_attempt_at <= NOW()
+            ORDER BY update_id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING u.update_id, u.payload, u.attempts
+    """, (UPDATES_LEASE_SECONDS, limit))
+    rows = cursor.fetchall()
+    conn.commit()
+    cursor.close()
+    return rows
+
+
+def finish_update(conn, update_id: int, attempts: int, error: Optional[str]) -> None:
+    schema = get_schema()
+    if error is None:
+        status, delay = "processed", 0
+    elif attempts >= UPDATES_MAX_ATTEMPTS:
+        status, delay = "failed", 0
+    else:
+        status, delay = "pending", min(5 * 2 ** (attempts - 1), 600)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        UPDATE {schema}telegram_updates
+        SET status = %s,
+            last_error = %s,
+            next_attempt_at = NOW() + make_interval(secs => %s),
+            processed_at = CASE WHEN %s IN ('processed', 'failed') THEN NOW() END
+        WHERE update_id = %s
+    """, (status, error, delay, status, update_id))
+    conn.commit()
+    cursor.close()
+
+
+def purge_processed_updates(conn, limit: int = 1000) -> int:
+    """Удаляет старые обработанные update, сохраняя окно дедупликации."""
+    schema = get_schema()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        DELETE FROM {schema}telegram_updates
+        WHERE update_id IN (
+            SELECT update_id FROM {schema}telegram_updates
+            WHERE status IN ('processed', 'failed')
+              AND processed_at < NOW() - make_interval(hours => %s)
+            LIMIT %s
+        )
+    """, (UPDATES_RETENTION_HOURS, limit))
+    purged = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    return purged
+
+
+def process_pending_updates(time_budget: float = OUTBOX_DRAIN_SECONDS, poll: bool = False) -> dict:
+    """
+    Обрабатывает ожидающие update; с poll=True не выходит на пустой очереди,
+    а опрашивает её каждые UPDATES_POLL_INTERVAL до конца бюджета.
+    Соединение берётся только на захват и запись итогов: пока идут вызовы
+    Bot API, оно возвращено в пул, и save_auth_token не ждёт второе.
+    """
+    stats = {"processed": 0, "retried": 0, "failed": 0}
+    deadline = time.monotonic() + time_budget
+    try:
+        while time.monotonic() < deadline:
+            conn = get_db_connection()
+            try:
+                rows = claim_updates(conn, UPDATES_BATCH_SIZE)
+            finally:
+                release_db_connection(conn)
+            if not rows:
+                if not poll:
+                    break
+                time.sleep(min(UPDATES_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+                continue
+
+            results = []
+            for claimed_id, payload, attempts in rows:
+                error = None
+                try:
+                    handle_update(payload)
+                except Exception as e:
+                    print(f"Error processing update {claimed_id}: {e}")
+                    error = str(e)
+                results.append((claimed_id, attempts, error))
+
+            conn = get_db_connection()
+            try:
+                for claimed_id, attempts, error in results:
+                    finish_update(conn, claimed_id, attempts, error)
+            finally:
+                release_db_connection(conn)
+            for _, attempts, error in results:
+                if error is None:
+                    stats["processed"] += 1
+                elif attempts >= UPDATES_MAX_ATTEMPTS:
+                    stats["failed"] += 1
+                else:
+                    stats["retried"] += 1
+        conn = get_db_connection()
+        try:
+            stats["purged"] = purge_processed_updates(conn)
+        finally:
+            release_db_connection(conn)
     except Exception as e:
-        print(f"Error processing webhook: {e}")
+        print(f"Error draining updates: {e}")
+        stats["error"] = str(e)
+    return stats
 
-    return {"statusCode": 200, "body": json.dumps({"ok": True})}
+
+def handle_process_updates(event: dict, body: dict) -> dict:
+    """
+    POST ?action=process-updates
+    Worker entry point for a scheduled trigger: handles the updates the webhook
+    acknowledged. With {"poll_seconds": N} it keeps polling for new updates
+    for up to N seconds, so a once-a-minute timer answers /start promptly.
+    """
+    if not is_worker_authorized(event):
+        return error_response(401, "Unauthorized")
+
+    poll_seconds = min(float(body.get("poll_seconds") or 0), UPDATES_POLL_MAX_SECONDS)
+    if poll_seconds > 0:
+        stats = process_pending_updates(time_budget=poll_seconds, poll=True)
+    else:
+        stats = process_pending_updates()
+    return json_response(500 if "error" in stats else 200, stats)
 
 
 # =============================================================================
@@ -190,13 +704,20 @@ def handle_send(body: dict) -> dict:
     silent = body.get("silent", False)
 
     if not text:
-        return cors_response(400, {"error": "text is required"})
+        return error_response(400, "text is required")
 
     if not chat_id:
-        return cors_response(400, {"error": "chat_id is required"})
+        return error_response(400, "chat_id is required")
 
     if len(text) > 4096:
-        return cors_response(400, {"error": "Message too long (max 4096 characters)"})
+        return error_response(400, "Message too long (max 4096 characters)")
+
+    if body.get("queue"):
+        return enqueue_notification("message", chat_id, {
+            "text": text,
+            "parse_mode": parse_mode,
+            "silent": silent,
+        })
 
     try:
         bot = get_bot()
@@ -207,17 +728,14 @@ def handle_send(body: dict) -> dict:
             disable_notification=silent,
             disable_web_page_preview=True,
         )
-        return cors_response(200, {
+        return json_response(200, {
             "success": True,
             "message_id": result.message_id,
         })
     except telebot.apihelper.ApiTelegramException as e:
-        return cors_response(400, {
-            "error": e.description,
-            "error_code": e.error_code,
-        })
+        return error_response(400, e.description, error_code=e.error_code)
     except Exception as e:
-        return cors_response(500, {"error": str(e)})
+        return error_response(500, str(e))
 
 
 def handle_send_photo(body: dict) -> dict:
@@ -231,10 +749,17 @@ def handle_send_photo(body: dict) -> dict:
     parse_mode = body.get("parse_mode", "HTML")
 
     if not photo_url:
-        return cors_response(400, {"error": "photo_url is required"})
+        return error_response(400, "photo_url is required")
 
     if not chat_id:
-        return cors_response(400, {"error": "chat_id is required"})
+        return error_response(400, "chat_id is required")
+
+    if body.get("queue"):
+        return enqueue_notification("photo", chat_id, {
+            "photo_url": photo_url,
+            "caption": caption,
+            "parse_mode": parse_mode,
+        })
 
     try:
         bot = get_bot()
@@ -244,17 +769,14 @@ def handle_send_photo(body: dict) -> dict:
             caption=caption if caption else None,
             parse_mode=parse_mode,
         )
-        return cors_response(200, {
+        return json_response(200, {
             "success": True,
             "message_id": result.message_id,
         })
     except telebot.apihelper.ApiTelegramException as e:
-        return cors_response(400, {
-            "error": e.description,
-            "error_code": e.error_code,
-        })
+        return error_response(400, e.description, error_code=e.error_code)
     except Exception as e:
-        return cors_response(500, {"error": str(e)})
+        return error_response(500, str(e))
 
 
 def handle_test(body: dict) -> dict:
@@ -265,7 +787,7 @@ def handle_test(body: dict) -> dict:
     chat_id = body.get("chat_id") or get_default_chat_id()
 
     if not chat_id:
-        return cors_response(400, {"error": "chat_id is required"})
+        return error_response(400, "chat_id is required")
 
     text = f"""<b>Тестовое сообщение</b>
 
@@ -280,18 +802,305 @@ def handle_test(body: dict) -> dict:
             text=text,
             parse_mode="HTML",
         )
-        return cors_response(200, {
+        return json_response(200, {
             "success": True,
             "message": "Test message sent",
             "message_id": result.message_id,
         })
     except telebot.apihelper.ApiTelegramException as e:
-        return cors_response(400, {
-            "error": e.description,
-            "error_code": e.error_code,
-        })
+        return error_response(400, e.description, error_code=e.error_code)
+    except Exception as e:
+        return error_response(500, str(e))
+
+
+# =============================================================================
+# BATCH SENDING
+# =============================================================================
+
+# Расписание отправок общее для всех рассылок экземпляра функции
+_send_slots_lock = threading.Lock()
+_send_next_slot = 0.0
+_chat_next_slot = {}
+
+
+def _reserve_send_slot(chat_id: str, not_after: Optional[float] = None) -> float:
+    """
+    Резервирует слот с учётом общего и поштучного лимита, возвращает паузу.
+    Слот позже not_after не резервируется: пауза возвращается, расписание не сдвигается.
+    """
+    global _send_next_slot
+    with _send_slots_lock:
+        now = time.monotonic()
+        if len(_chat_next_slot) > 10_000:
+            for key in [key for key, slot in _chat_next_slot.items() if slot < now]:
+                del _chat_next_slot[key]
+        slot = max(now, _send_next_slot, _chat_next_slot.get(chat_id, 0.0))
+        if not_after is not None and slot > not_after:
+            return slot - now
+        _send_next_slot = slot + 1 / BATCH_GLOBAL_RATE
+        _chat_next_slot[chat_id] = slot + BATCH_PER_CHAT_INTERVAL
+        return slot - now
+
+
+def _pause_sending(seconds: float) -> None:
+    """После 429 Telegram ограничивает всего бота — сдвигаем общее расписание."""
+    global _send_next_slot
+    with _send_slots_lock:
+        _send_next_slot = max(_send_next_slot, time.monotonic() + seconds)
+
+
+def _retry_after(error: "telebot.apihelper.ApiTelegramException") -> Optional[float]:
+    if error.error_code != 429:
+        return None
+    parameters = (error.result_json or {}).get("parameters") or {}
+    return float(parameters.get("retry_after", 1))
+
+
+def send_rate_limited(bot: "telebot.TeleBot", chat_id, text: str, parse_mode: str, silent: bool) -> dict:
+    """Отправляет одно сообщение рассылки, повторяя после 429 через retry_after."""
+    for attempt in range(BATCH_MAX_RETRIES + 1):
+        delay = _reserve_send_slot(str(chat_id))
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            result = bot.send_message(
+                chat_id=chat_id,
+                text=text,
+                parse_mode=parse_mode,
+                disable_notification=silent,
+                disable_web_page_preview=True,
+            )
+            return {"chat_id": chat_id, "success": True, "message_id": result.message_id}
+        except telebot.apihelper.ApiTelegramException as e:
+            retry_after = _retry_after(e)
+            if retry_after is None or attempt == BATCH_MAX_RETRIES:
+                return {"chat_id": chat_id, "success": False, "error": e.description, "error_code": e.error_code}
+            _pause_sending(retry_after)
+        except Exception as e:
+            return {"chat_id": chat_id, "success": False, "error": str(e)}
+
+
+def handle_send_batch(body: dict) -> dict:
+    """
+    POST ?action=send-batch
+    Send one text message to many chats within Telegram rate limits.
+    """
+    text = body.get("text", "").strip()
+    chat_ids = body.get("chat_ids") or []
+    parse_mode = body.get("parse_mode", "HTML")
+    silent = body.get("silent", False)
+
+    if not text:
+        return error_response(400, "text is required")
+
+    if not isinstance(chat_ids, list) or not chat_ids:
+        return error_response(400, "chat_ids must be a non-empty list")
+
+    if len(chat_ids) > BATCH_MAX_RECIPIENTS:
+        return error_response(400, f"Too many recipients (max {BATCH_MAX_RECIPIENTS})")
+
+    if len(text) > 4096:
+        return error_response(400, "Message too long (max 4096 characters)")
+
+    try:
+        bot = get_bot()
+    except ValueError as e:
+        return error_response(500, str(e))
+
+    with ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, len(chat_ids))) as pool:
+        results = list(pool.map(
+            lambda chat_id: send_rate_limited(bot, chat_id, text, parse_mode, silent),
+            chat_ids,
+        ))
+
+    sent = sum(1 for result in results if result["success"])
+    return json_response(200, {
+        "success": sent == len(results),
+        "sent": sent,
+        "failed": len(results) - sent,
+        "results": results,
+    })
+
+
+# =============================================================================
+# NOTIFICATION OUTBOX
+# =============================================================================
+
+def enqueue_notification(kind: str, chat_id, payload: dict) -> dict:
+    """Сохраняет уведомление в outbox одной вставкой и сразу отвечает 202."""
+    schema = get_schema()
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            INSERT INTO {schema}notification_outbox (kind, chat_id, payload)
+            VALUES (%s, %s, %s)
+            RETURNING id
+        """, (kind, str(chat_id), psycopg2_extras.Json(payload)))
+        outbox_id = cursor.fetchone()[0]
+        conn.commit()
+    except Exception as e:
+        return error_response(500, str(e))
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+    return json_response(202, {"success": True, "queued": True, "id": outbox_id})
+
+
+def claim_outbox_batch(conn, limit: int) -> list:
+    """
+    Захватывает пачку готовых записей. SKIP LOCKED позволяет нескольким
+    воркерам разбирать очередь параллельно, а аренда через next_attempt_at
+    возвращает записи упавшего воркера в очередь.
+    """
+    schema = get_schema()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        UPDATE {schema}notification_outbox AS o
+        SET status = 'sending',
+            attempts = o.attempts + 1,
+            next_attempt_at = NOW() + make_interval(secs => %s)
+        WHERE o.id IN (
+            SELECT id FROM {schema}notification_outbox
+            WHERE status IN ('pending', 'sending') AND next_attempt_at <= NOW()
+            ORDER BY next_attempt_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING o.id, o.kind, o.chat_id, o.payload, o.attempts
+    """, (OUTBOX_LEASE_SECONDS, limit))
+    rows = cursor.fetchall()
+    conn.commit()
+    cursor.close()
+    return rows
+
+
+def deliver_outbox_item(bot: "telebot.TeleBot", row: tuple, send_deadline: float) -> tuple:
+    """
+    Отправляет одну запись; возвращает (id, статус, message_id, ошибка, пауза).
+    Если слот отправки наступает после send_deadline, запись не отправляется
+    и возвращается как deferred с оставшейся паузой.
+    """
+    outbox_id, kind, chat_id, payload, attempts = row
+    delay = _reserve_send_slot(chat_id, not_after=send_deadline)
+    if time.monotonic() + delay > send_deadline:
+        return outbox_id, "deferred", None, None, delay
+    if delay > 0:
+        time.sleep(delay)
+    try:
+        if kind == "photo":
+            result = bot.send_photo(
+                chat_id=chat_id,
+                photo=payload["photo_url"],
+                caption=payload.get("caption") or None,
+                parse_mode=payload.get("parse_mode", "HTML"),
+            )
+        else:
+            result = bot.send_message(
+                chat_id=chat_id,
+                text=payload["text"],
+                parse_mode=payload.get("parse_mode", "HTML"),
+                disable_notification=payload.get("silent", False),
+                disable_web_page_preview=True,
+            )
+        return outbox_id, "sent", result.message_id, None, 0.0
+    except telebot.apihelper.ApiTelegramException as e:
+        retry_after = _retry_after(e)
+        if retry_after is None and 400 <= e.error_code < 500:
+            return outbox_id, "failed", None, e.description, 0.0
+        if retry_after is not None:
+            _pause_sending(retry_after)
+        error = e.description
     except Exception as e:
-        return cors_response(500, {"error": str(e)})
+        retry_after = None
+        error = str(e)
+
+    # 429 тоже расходует попытку, иначе запись могла бы откладываться бесконечно
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        return outbox_id, "failed", None, error, 0.0
+    if retry_after is not None:
+        return outbox_id, "pending", None, error, retry_after
+    backoff = min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+    return outbox_id, "pending", None, error, backoff
+
+
+def record_outbox_results(conn, results: list) -> None:
+    """
+    Записывает итоги пачки одним UPDATE ... FROM (VALUES ...).
+    Отложенная запись возвращается в очередь без траты попытки.
+    """
+    schema = get_schema()
+    cursor = conn.cursor()
+    psycopg2_extras.execute_values(cursor, f"""
+        UPDATE {schema}notification_outbox AS o
+        SET status = CASE WHEN v.status = 'deferred' THEN 'pending' ELSE v.status END,
+            attempts = o.attempts - CASE WHEN v.status = 'deferred' THEN 1 ELSE 0 END,
+            message_id = v.message_id,
+            last_error = CASE WHEN v.status = 'deferred' THEN o.last_error ELSE v.last_error END,
+            next_attempt_at = NOW() + make_interval(secs => v.delay),
+            sent_at = CASE WHEN v.status = 'sent' THEN NOW() ELSE o.sent_at END
+        FROM (VALUES %s) AS v(id, status, message_id, last_error, delay)
+        WHERE o.id = v.id
+    """, results, template="(%s::bigint, %s, %s::bigint, %s, %s::float8)")
+    conn.commit()
+    cursor.close()
+
+
+def drain_outbox(batch_size: int = OUTBOX_BATCH_SIZE, time_budget: float = OUTBOX_DRAIN_SECONDS) -> dict:
+    """
+    Разбирает очередь пачками, пока она не опустеет или не выйдет время.
+    Соединение берётся только на захват и запись итогов: на время отправки
+    оно возвращено в пул, записи защищены арендой.
+    """
+    bot = get_bot()
+    batch_size = min(batch_size, OUTBOX_MAX_BATCH_SIZE)
+    stats = {"claimed": 0, "sent": 0, "retried": 0, "deferred": 0, "failed": 0, "batches": 0}
+    deadline = time.monotonic() + time_budget
+    with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as pool:
+        while time.monotonic() < deadline:
+            conn = get_db_connection()
+            try:
+                rows = claim_outbox_batch(conn, batch_size)
+            finally:
+                release_db_connection(conn)
+            if not rows:
+                break
+
+            # Аренда отсчитывается от захвата; новые отправки не начинаются и после бюджета
+            send_deadline = min(time.monotonic() + OUTBOX_SEND_WINDOW, deadline)
+            results = list(pool.map(lambda row: deliver_outbox_item(bot, row, send_deadline), rows))
+
+            conn = get_db_connection()
+            try:
+                record_outbox_results(conn, results)
+            finally:
+                release_db_connection(conn)
+            stats["batches"] += 1
+            stats["claimed"] += len(rows)
+            for _, status, _, _, _ in results:
+                key = {"sent": "sent", "failed": "failed", "deferred": "deferred"}.get(status, "retried")
+                stats[key] += 1
+            # Вся пачка отложена (общая пауза после 429): дальше захватывать бессмысленно
+            if all(status == "deferred" for _, status, _, _, _ in results):
+                break
+    return stats
+
+
+def handle_drain_outbox(event: dict, body: dict) -> dict:
+    """
+    POST ?action=drain-outbox
+    Worker entry point for a scheduled trigger; several may run in parallel.
+    """
+    if not is_worker_authorized(event):
+        return error_response(401, "Unauthorized")
+
+    batch_size = min(int(body.get("batch_size") or OUTBOX_BATCH_SIZE), OUTBOX_MAX_BATCH_SIZE)
+    try:
+        return json_response(200, drain_outbox(batch_size))
+    except Exception as e:
+        return error_response(500, str(e))
 
 
 # =============================================================================
@@ -308,6 +1117,16 @@ def handler(event: dict, context) -> dict:
     params = event.get("queryStringParameters") or {}
     action = params.get("action", "")
 
+    if not admit(ACTION_PRIORITIES.get(action, "normal")):
+        return overloaded_response()
+    try:
+        return route_request(event, method, action)
+    finally:
+        release_admission()
+
+
+def route_request(event: dict, method: str, action: str) -> dict:
+    """Notification API по action, без action — webhook Telegram."""
     # If action specified — handle notification API
     if action:
         body = {}
@@ -316,16 +1135,22 @@ def handler(event: dict, context) -> dict:
             try:
                 body = json.loads(raw_body) if raw_body else {}
             except json.JSONDecodeError:
-                return cors_response(400, {"error": "Invalid JSON"})
+                return error_response(400, "Invalid JSON")
 
         if action == "send" and method == "POST":
             return handle_send(body)
         elif action == "send-photo" and method == "POST":
             return handle_send_photo(body)
+        elif action == "send-batch" and method == "POST":
+            return handle_send_batch(body)
+        elif action == "drain-outbox" and method == "POST":
+            return handle_drain_outbox(event, body)
+        elif action == "process-updates" and method == "POST":
+            return handle_process_updates(event, body)
         elif action == "test" and method == "POST":
             return handle_test(body)
         else:
-            return cors_response(400, {"error": f"Unknown action: {action}"})
+            return error_response(400, f"Unknown action: {action}")
 
     # No action — handle Telegram webhook
     headers = event.get("headers", {})
@@ -335,7 +1160,7 @@ def handler(event: dict, context) -> dict:
     if webhook_secret:
         request_secret = headers_lower.get("x-telegram-bot-api-secret-token", "")
         if request_secret != webhook_secret:
-            return {"statusCode": 401, "body": json.dumps({"error": "Unauthorized"})}
+            return json_response(401, {"error": "Unauthorized"}, WEBHOOK_HEADERS)
 
     body = json.loads(event.get("body", "{}"))
     return process_webhook(body)
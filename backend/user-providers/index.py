@@ -1,11 +1,297 @@
 import json
 import os
-import psycopg2
-import jwt
+import sys
+import hashlib
+import hmac
+import importlib
+import threading
+import time
+from collections import OrderedDict
 from typing import Optional
 
+# Тяжёлые зависимости импортируются при первом обращении к атрибуту, поэтому
+# холодный старт и preflight OPTIONS за них не платят
+class LazyModule:
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+jwt = LazyModule('jwt')
+psycopg2 = LazyModule('psycopg2')
+psycopg2_extras = LazyModule('psycopg2.extras')
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '5'))
+DB_POOL_CHECK_AFTER = float(os.environ.get('DB_POOL_CHECK_AFTER', '30'))
+
+# Пул живёт на уровне модуля, чтобы тёплые вызовы переиспользовали соединения
+_db_pool = []
+_db_pool_cond = threading.Condition()
+_db_pool_stats = {'hits': 0, 'misses': 0, 'open': 0, 'discarded': 0, 'prepared': 0}
+
+# Контроль допуска (AIMD): лимит запросов в работе растёт на 1/лимит после каждого быстрого
+# SQL-запроса и умножается на ADMISSION_BACKOFF, когда запрос и сглаженная задержка выше цели
+# или пул исчерпан. Сверх лимита первыми отбрасываются запросы низкого приоритета
+ADMISSION_MIN_LIMIT = int(os.environ.get('ADMISSION_MIN_LIMIT', '2'))
+ADMISSION_MAX_LIMIT = int(os.environ.get('ADMISSION_MAX_LIMIT', str(DB_POOL_MAX_SIZE * 4)))
+ADMISSION_LATENCY_TARGET = float(os.environ.get('ADMISSION_LATENCY_TARGET', '0.25'))
+ADMISSION_BACKOFF = 0.75
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', '2'))
+# Доля лимита для каждого приоритета; список провайдеров отбрасывается первым
+ADMISSION_SHARES = {
+    'critical': None,
+    'normal': 1.0,
+    'low': float(os.environ.get('ADMISSION_LOW_PRIORITY_SHARE', '0.5')),
+}
+METHOD_PRIORITIES = {'GET': 'low'}
+
+_admission = {'limit': float(ADMISSION_MAX_LIMIT), 'inflight': 0, 'latency': 0.0, 'decreased_at': 0.0, 'shed': 0}
+_admission_lock = threading.Lock()
+
+# Горячие запросы разбираются и планируются один раз на соединение пула, затем вызываются через EXECUTE
+PREPARED_STATEMENTS = {
+    'providers_list': '''SELECT provider, provider_user_id, provider_email, linked_at
+        FROM {schema}user_providers
+        WHERE user_id = $1
+        ORDER BY linked_at DESC''',
+}
+# id(соединения) -> имена уже подготовленных на нём запросов; запись удаляется вместе с соединением
+_prepared_by_conn = {}
+# Класс курсора с замером времени запросов создаётся при первом соединении
+_timed_cursor_class = None
+
+JWT_SECRET = os.environ.get('JWT_SECRET')
+JWT_CACHE_MAX_SIZE = int(os.environ.get('JWT_CACHE_MAX_SIZE', '1024'))
+
+# Разобранные токены: префикс хеша -> (полный хеш, payload, exp); SPA присылает один и тот же токен
+_jwt_cache = OrderedDict()
+_jwt_cache_lock = threading.Lock()
+
+PROVIDERS_VERSION_TTL = float(os.environ.get('PROVIDERS_VERSION_TTL', '10'))
+PROVIDERS_VERSION_CACHE_SIZE = int(os.environ.get('PROVIDERS_VERSION_CACHE_SIZE', '4096'))
+
+# Версии списка провайдеров: user_id -> (etag, время). Привязку может изменить другой экземпляр,
+# поэтому TTL короткий; свои изменения клиент видит сразу: link/unlink возвращают новый ETag и список
+_providers_versions = OrderedDict()
+_providers_versions_lock = threading.Lock()
+
+BULK_LINK_PAGE_SIZE = int(os.environ.get('BULK_LINK_PAGE_SIZE', '2000'))
+BULK_LINK_PAGE_RETRIES = 3
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Словари заголовков собираются один раз при импорте и общие для всех ответов
+class FrozenHeaders(dict):
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('FrozenHeaders is read-only, copy it with dict(...)')
+    
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+
+JSON_HEADERS = FrozenHeaders({'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'})
+OPTIONS_HEADERS = FrozenHeaders({
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-Authorization, If-None-Match',
+    'Access-Control-Expose-Headers': 'ETag'
+})
+OVERLOADED_HEADERS = FrozenHeaders({**JSON_HEADERS, 'Retry-After': str(ADMISSION_RETRY_AFTER)})
+REVALIDATE_HEADERS = FrozenHeaders({
+    'Cache-Control': 'private, no-cache',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Expose-Headers': 'ETag'
+})
+
+def _json_default(value):
+    return str(value)
+
+def dump_json(body) -> str:
+    if orjson is not None:
+        return orjson.dumps(
+            body,
+            default=_json_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        ).decode()
+    return json.dumps(body, default=_json_default)
+
+def json_response(status: int, body, headers: dict = JSON_HEADERS) -> dict:
+    return {'statusCode': status, 'headers': headers, 'body': dump_json(body), 'isBase64Encoded': False}
+
+def error_response(status: int, message: str, **extra) -> dict:
+    return json_response(status, {'error': message, **extra})
+
+def options_response() -> dict:
+    return {'statusCode': 200, 'headers': OPTIONS_HEADERS, 'body': '', 'isBase64Encoded': False}
+
+def overloaded_response() -> dict:
+    return json_response(503, {'error': 'Service overloaded, retry later'}, OVERLOADED_HEADERS)
+
+def timed_cursor_class():
+    global _timed_cursor_class
+    if _timed_cursor_class is None:
+        class TimedCursor(psycopg2.extensions.cursor):
+            def execute(self, query, vars=None):
+                started = time.monotonic()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    observe_db_latency(time.monotonic() - started)
+        _timed_cursor_class = TimedCursor
+    return _timed_cursor_class
+
+def _open_db_connection():
+    return psycopg2.connect(os.environ['DATABASE_URL'], cursor_factory=timed_cursor_class())
+
+def _is_connection_healthy(conn, idle_since: float) -> bool:
+    if conn.closed:
+        return False
+    if time.monotonic() - idle_since < DB_POOL_CHECK_AFTER:
+        return True
+    try:
+        # Пинг в autocommit не открывает транзакцию, и откатывать после него нечего
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+        finally:
+            conn.autocommit = False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _discard_db_connection(conn) -> None:
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+    with _db_pool_cond:
+        _prepared_by_conn.pop(id(conn), None)
+        _db_pool_stats['open'] -= 1
+        _db_pool_stats['discarded'] += 1
+        _db_pool_cond.notify()
+
 def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        return _checkout_db_connection()
+    except psycopg2.OperationalError:
+        observe_db_latency(None)
+        raise
+
+def _checkout_db_connection():
+    deadline = time.monotonic() + DB_POOL_WAIT_TIMEOUT
+    while True:
+        with _db_pool_cond:
+            while not _db_pool and _db_pool_stats['open'] >= DB_POOL_MAX_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise psycopg2.OperationalError('Connection pool exhausted')
+                _db_pool_cond.wait(remaining)
+            if not _db_pool:
+                _db_pool_stats['open'] += 1
+                _db_pool_stats['misses'] += 1
+                break
+            conn, idle_since = _db_pool.pop()
+        if _is_connection_healthy(conn, idle_since):
+            with _db_pool_cond:
+                _db_pool_stats['hits'] += 1
+            return conn
+        _discard_db_connection(conn)
+
+    try:
+        return _open_db_connection()
+    except Exception:
+        with _db_pool_cond:
+            _db_pool_stats['open'] -= 1
+            _db_pool_cond.notify()
+        raise
+
+def release_db_connection(conn) -> None:
+    if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+    if conn.closed or conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        _discard_db_connection(conn)
+        return
+    with _db_pool_cond:
+        _db_pool.append((conn, time.monotonic()))
+        _db_pool_cond.notify()
+
+def get_pool_stats() -> dict:
+    with _db_pool_cond:
+        return {**_db_pool_stats, 'idle': len(_db_pool), 'max_size': DB_POOL_MAX_SIZE}
+
+def admit(priority: str) -> bool:
+    share = ADMISSION_SHARES[priority]
+    with _admission_lock:
+        if share is not None and _admission['inflight'] >= _admission['limit'] * share:
+            _admission['shed'] += 1
+            return False
+        _admission['inflight'] += 1
+        return True
+
+def release_admission() -> None:
+    with _admission_lock:
+        _admission['inflight'] -= 1
+
+def observe_db_latency(seconds: Optional[float]) -> None:
+    '''Шаг AIMD по времени выполнения запроса; None — соединение получить не удалось'''
+    now = time.monotonic()
+    with _admission_lock:
+        slow = seconds is None or seconds > ADMISSION_LATENCY_TARGET
+        if seconds is not None:
+            # Один долгий запрос (пакетная вставка, обслуживание) не должен держать среднее выше цели
+            seconds = min(seconds, ADMISSION_LATENCY_TARGET * 4)
+            previous = _admission['latency']
+            _admission['latency'] = seconds if not previous else previous * 0.8 + seconds * 0.2
+        # Уменьшает лимит только медленный запрос при высокой средней, и не чаще раза за интервал цели
+        if slow and (seconds is None or _admission['latency'] > ADMISSION_LATENCY_TARGET):
+            if now - _admission['decreased_at'] >= ADMISSION_LATENCY_TARGET:
+                _admission['limit'] = max(ADMISSION_MIN_LIMIT, _admission['limit'] * ADMISSION_BACKOFF)
+                _admission['decreased_at'] = now
+        elif not slow:
+            _admission['limit'] = min(ADMISSION_MAX_LIMIT, _admission['limit'] + 1 / _admission['limit'])
+
+def get_admission_stats() -> dict:
+    with _admission_lock:
+        return {**_admission, 'limit': round(_admission['limit'], 2)}
+
+def execute_prepared(cursor, name: str, params: tuple) -> None:
+    conn = cursor.connection
+    with _db_pool_cond:
+        prepared = _prepared_by_conn.setdefault(id(conn), set())
+    fresh_transaction = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    if name not in prepared:
+        _prepare_statement(cursor, name, prepared)
+    execute = f"EXECUTE {name}({', '.join(['%s'] * len(params))})"
+    try:
+        cursor.execute(execute, params)
+    except psycopg2.Error as e:
+        # 26000: сервер больше не знает запрос (соединение пересоздано, DISCARD ALL в пулере)
+        if e.pgcode != '26000':
+            raise
+        prepared.clear()
+        if not fresh_transaction:
+            raise
+        conn.rollback()
+        _prepare_statement(cursor, name, prepared)
+        cursor.execute(execute, params)
+
+def _prepare_statement(cursor, name: str, prepared: set) -> None:
+    cursor.execute(f'PREPARE {name} AS ' + PREPARED_STATEMENTS[name].format(schema=get_schema()))
+    prepared.add(name)
+    with _db_pool_cond:
+        _db_pool_stats['prepared'] += 1
 
 def get_schema() -> str:
     schema = os.environ.get("MAIN_DB_SCHEMA", "public")
@@ -16,36 +302,39 @@ def handler(event: dict, context) -> dict:
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Authorization'
-            },
-            'body': ''
-        }
-    
-    auth_header = event.get('headers', {}).get('X-Authorization', '')
+        return options_response()
+    
+    headers = event.get('headers') or {}
+    auth_header = headers.get('X-Authorization', '')
     if not auth_header or not auth_header.startswith('Bearer '):
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Unauthorized'})
-        }
+        return error_response(401, 'Unauthorized')
     
     token = auth_header.replace('Bearer ', '')
     user_id = verify_token(token)
     
     if not user_id:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid token'})
-        }
+        return error_response(401, 'Invalid token')
+    
+    if method == 'GET':
+        # 304 по закешированной версии не трогает БД и поэтому не проходит контроль допуска
+        if_none_match = headers.get('If-None-Match') or headers.get('if-none-match', '')
+        cached_etag = get_cached_providers_version(user_id)
+        if cached_etag and etag_matches(if_none_match, cached_etag):
+            return not_modified(cached_etag)
+    
+    if not admit(METHOD_PRIORITIES.get(method, 'normal')):
+        return overloaded_response()
+    try:
+        return route_request(event, method, user_id)
+    finally:
+        release_admission()
+
+def route_request(event: dict, method: str, user_id: int) -> dict:
+    headers = event.get('headers') or {}
     
     if method == 'GET':
-        return get_user_providers(user_id)
+        if_none_match = headers.get('If-None-Match') or headers.get('if-none-match', '')
+        return get_user_providers(user_id, if_none_match)
     elif method == 'POST':
         body = json.loads(event.get('body', '{}'))
         return link_provider(user_id, body)
@@ -54,53 +343,115 @@ def handler(event: dict, context) -> dict:
         provider = params.get('provider')
         return unlink_provider(user_id, provider)
     
-    return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'})
-    }
+    return error_response(405, 'Method not allowed')
 
-def verify_token(token: str) -> Optional[int]:
+def decode_token(token: str) -> Optional[dict]:
+    if not JWT_SECRET:
+        return None
     try:
-        jwt_secret = os.environ.get('JWT_SECRET')
-        if not jwt_secret:
-            return None
-        
-        payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
-        return payload.get('user_id')
+        return jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         return None
 
-def get_user_providers(user_id: int) -> dict:
+def verify_token(token: str) -> Optional[int]:
+    digest = hashlib.sha256(token.encode()).digest()
+    key = digest[:16]
+    now = time.time()
+    
+    with _jwt_cache_lock:
+        entry = _jwt_cache.get(key)
+        if entry is not None:
+            cached_digest, payload, exp = entry
+            if exp > now and hmac.compare_digest(cached_digest, digest):
+                _jwt_cache.move_to_end(key)
+                return payload.get('user_id')
+            del _jwt_cache[key]
+    
+    payload = decode_token(token)
+    if not payload:
+        return None
+    
+    exp = payload.get('exp')
+    if exp:
+        with _jwt_cache_lock:
+            _jwt_cache[key] = (digest, payload, exp)
+            while len(_jwt_cache) > JWT_CACHE_MAX_SIZE:
+                _jwt_cache.popitem(last=False)
+    return payload.get('user_id')
+
+def get_cached_providers_version(user_id: int) -> Optional[str]:
+    with _providers_versions_lock:
+        entry = _providers_versions.get(user_id)
+        if entry is None:
+            return None
+        etag, cached_at = entry
+        if time.monotonic() - cached_at > PROVIDERS_VERSION_TTL:
+            del _providers_versions[user_id]
+            return None
+        _providers_versions.move_to_end(user_id)
+        return etag
+
+def cache_providers_version(user_id: int, etag: str) -> None:
+    with _providers_versions_lock:
+        _providers_versions[user_id] = (etag, time.monotonic())
+        _providers_versions.move_to_end(user_id)
+        while len(_providers_versions) > PROVIDERS_VERSION_CACHE_SIZE:
+            _providers_versions.popitem(last=False)
+
+def providers_etag(user_id: int, rows: list) -> str:
+    latest = max((row[3] for row in rows if row[3]), default=None)
+    version = f'{user_id}:{len(rows)}:{latest.isoformat() if latest else ""}'
+    return '"' + hashlib.sha256(version.encode()).hexdigest()[:20] + '"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return '*' in candidates or any(value.removeprefix('W/') == etag for value in candidates)
+
+def not_modified(etag: str) -> dict:
+    return {'statusCode': 304, 'headers': {**REVALIDATE_HEADERS, 'ETag': etag}, 'body': '', 'isBase64Encoded': False}
+
+def get_user_providers(user_id: int, if_none_match: str = '') -> dict:
+    cached_etag = get_cached_providers_version(user_id)
+    if cached_etag and etag_matches(if_none_match, cached_etag):
+        return not_modified(cached_etag)
+    
     conn = get_db_connection()
-    schema = get_schema()
     try:
         with conn.cursor() as cur:
-            cur.execute(
-                f'''SELECT provider, provider_user_id, provider_email, linked_at 
-                   FROM {schema}user_providers 
-                   WHERE user_id = %s 
-                   ORDER BY linked_at DESC''',
-                (user_id,)
-            )
+            execute_prepared(cur, 'providers_list', (user_id,))
             rows = cur.fetchall()
-            
-            providers = []
-            for row in rows:
-                providers.append({
-                    'provider': row[0],
-                    'providerId': row[1],
-                    'email': row[2],
-                    'linkedAt': row[3].isoformat() if row[3] else None
-                })
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'providers': providers})
-            }
     finally:
-        conn.close()
+        release_db_connection(conn)
+    
+    etag = providers_etag(user_id, rows)
+    cache_providers_version(user_id, etag)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    
+    headers = {**REVALIDATE_HEADERS, 'Content-Type': 'application/json', 'ETag': etag}
+    return json_response(200, {'providers': serialize_providers(rows)}, headers)
+
+def serialize_providers(rows: list) -> list:
+    return [{
+        'provider': row[0],
+        'providerId': row[1],
+        'email': row[2],
+        'linkedAt': row[3].isoformat() if row[3] else None
+    } for row in rows]
+
+def providers_changed_response(cur, user_id: int, message: str) -> dict:
+    execute_prepared(cur, 'providers_list', (user_id,))
+    rows = cur.fetchall()
+    etag = providers_etag(user_id, rows)
+    cache_providers_version(user_id, etag)
+    headers = {**REVALIDATE_HEADERS, 'Content-Type': 'application/json', 'ETag': etag}
+    return json_response(200, {
+        'success': True,
+        'message': message,
+        'providers': serialize_providers(rows)
+    }, headers)
 
 def link_provider(user_id: int, data: dict) -> dict:
     provider = data.get('provider')
@@ -109,11 +460,7 @@ def link_provider(user_id: int, data: dict) -> dict:
     provider_data = data.get('data', {})
     
     if not provider or not provider_user_id:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Provider and providerId are required'})
-        }
+        return error_response(400, 'Provider and providerId are required')
     
     conn = get_db_connection()
     schema = get_schema()
@@ -133,74 +480,169 @@ def link_provider(user_id: int, data: dict) -> dict:
             )
             conn.commit()
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'message': 'Provider linked successfully'})
-            }
+            return providers_changed_response(cur, user_id, 'Provider linked successfully')
     except Exception as e:
         conn.rollback()
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)})
-        }
+        return error_response(500, str(e))
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 def unlink_provider(user_id: int, provider: str) -> dict:
     if not provider:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Provider is required'})
-        }
+        return error_response(400, 'Provider is required')
     
     conn = get_db_connection()
     schema = get_schema()
     try:
         with conn.cursor() as cur:
+            # Блокировка всех привязок пользователя упорядочивает параллельные отвязки,
+            # и два запроса не могут удалить каждый по одному из двух последних провайдеров
             cur.execute(
-                f'SELECT COUNT(*) FROM {schema}user_providers WHERE user_id = %s',
-                (user_id,)
-            )
-            count = cur.fetchone()[0]
-            
-            if count <= 1:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Cannot unlink last provider'})
-                }
-            
-            cur.execute(
-                f'SELECT id FROM {schema}user_providers WHERE user_id = %s AND provider = %s',
+                f'''WITH locked AS (
+                       SELECT id, provider FROM {schema}user_providers
+                       WHERE user_id = %s
+                       ORDER BY id
+                       FOR UPDATE
+                   ), target AS (
+                       SELECT id FROM locked WHERE provider = %s
+                   ), deleted AS (
+                       DELETE FROM {schema}user_providers
+                       WHERE id IN (SELECT id FROM target)
+                         AND (SELECT COUNT(*) FROM locked) > 1
+                       RETURNING id
+                   )
+                   SELECT (SELECT COUNT(*) FROM locked), (SELECT COUNT(*) FROM deleted)''',
                 (user_id, provider)
             )
-            result = cur.fetchone()
+            linked, deleted = cur.fetchone()
+            conn.commit()
             
-            if not result:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Provider not found'})
-                }
+            if linked <= 1:
+                return error_response(400, 'Cannot unlink last provider')
             
-            provider_id = result[0]
-            cur.execute(f'DELETE FROM {schema}user_providers WHERE id = %s', (provider_id,))
-            conn.commit()
+            if not deleted:
+                return error_response(404, 'Provider not found')
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'message': 'Provider unlinked successfully'})
-            }
+            return providers_changed_response(cur, user_id, 'Provider unlinked successfully')
     except Exception as e:
         conn.rollback()
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)})
-        }
+        return error_response(500, str(e))
     finally:
-        conn.close()
\ No newline at end of file
+        release_db_connection(conn)
+
+def prepare_bulk_links(links: list) -> tuple:
+    rows = []
+    conflicts = []
+    by_user_provider = {}
+    identity_owner = {}
+    for index, link in enumerate(links):
+        user_id = link.get('user_id')
+        provider = link.get('provider')
+        provider_user_id = link.get('providerId')
+        if not isinstance(user_id, int) or not provider or not provider_user_id:
+            conflicts.append({'index': index, 'reason': 'invalid'})
+            continue
+        provider_user_id = str(provider_user_id)
+        owner = identity_owner.setdefault((provider, provider_user_id), user_id)
+        if owner != user_id:
+            conflicts.append({'index': index, 'reason': 'identity_taken', 'ownerUserId': owner})
+            continue
+        # ON CONFLICT не может дважды изменить одну строку за запрос: побеждает последняя привязка (пользователь, провайдер)
+        previous = by_user_provider.get((user_id, provider))
+        if previous is not None:
+            conflicts.append({'index': rows[previous][0], 'reason': 'superseded', 'byIndex': index})
+            rows[previous] = None
+        by_user_provider[(user_id, provider)] = len(rows)
+        rows.append((index, user_id, provider, provider_user_id,
+                     link.get('email'), json.dumps(link.get('data') or {})))
+    return [row for row in rows if row is not None], conflicts
+
+def upsert_links_page(conn, page: list) -> list:
+    schema = get_schema()
+    for attempt in range(BULK_LINK_PAGE_RETRIES):
+        try:
+            with conn.cursor() as cur:
+                rejected = psycopg2_extras.execute_values(cur, f'''
+                    WITH input (idx, user_id, provider, provider_user_id, provider_email, provider_data) AS (
+                        VALUES %s
+                    ), classified AS (
+                        SELECT i.*,
+                               CASE WHEN u.id IS NULL THEN 'unknown_user'
+                                    WHEN owner.user_id IS NOT NULL THEN 'identity_taken'
+                               END AS conflict,
+                               owner.user_id AS owner_id
+                        FROM input i
+                        LEFT JOIN {schema}users u ON u.id = i.user_id
+                        LEFT JOIN {schema}user_providers owner
+                               ON owner.provider = i.provider
+                              AND owner.provider_user_id = i.provider_user_id
+                              AND owner.user_id <> i.user_id
+                    ), upserted AS (
+                        INSERT INTO {schema}user_providers
+                            (user_id, provider, provider_user_id, provider_email, provider_data)
+                        SELECT user_id, provider, provider_user_id, provider_email, provider_data
+                        FROM classified
+                        WHERE conflict IS NULL
+                        ON CONFLICT (user_id, provider)
+                        DO UPDATE SET
+                            provider_user_id = EXCLUDED.provider_user_id,
+                            provider_email = EXCLUDED.provider_email,
+                            provider_data = EXCLUDED.provider_data,
+                            linked_at = CURRENT_TIMESTAMP
+                        RETURNING 1
+                    )
+                    SELECT idx, conflict, owner_id FROM classified WHERE conflict IS NOT NULL
+                ''', page, template='(%s, %s::integer, %s, %s, %s, %s::jsonb)',
+                    page_size=len(page), fetch=True)
+            conn.commit()
+            return rejected
+        except psycopg2.IntegrityError:
+            # Параллельный link_provider занял идентификатор между проверкой и вставкой
+            conn.rollback()
+            if attempt == BULK_LINK_PAGE_RETRIES - 1:
+                raise
+
+def bulk_link_providers(links: list, page_size: int = BULK_LINK_PAGE_SIZE) -> dict:
+    started = time.monotonic()
+    rows, conflicts = prepare_bulk_links(links)
+    linked = 0
+    
+    conn = get_db_connection()
+    try:
+        for offset in range(0, len(rows), page_size):
+            page = rows[offset:offset + page_size]
+            rejected = upsert_links_page(conn, page)
+            linked += len(page) - len(rejected)
+            for index, reason, owner_id in rejected:
+                conflict = {'index': index, 'reason': reason}
+                if owner_id is not None:
+                    conflict['ownerUserId'] = owner_id
+                conflicts.append(conflict)
+    finally:
+        release_db_connection(conn)
+    
+    seconds = time.monotonic() - started
+    conflicts.sort(key=lambda conflict: conflict['index'])
+    reasons = {}
+    for conflict in conflicts:
+        reasons[conflict['reason']] = reasons.get(conflict['reason'], 0) + 1
+    return {
+        'rows': len(links),
+        'linked': linked,
+        'conflicts': len(conflicts),
+        'conflictReasons': reasons,
+        'seconds': round(seconds, 3),
+        'rowsPerSecond': round(len(links) / seconds) if seconds else None,
+        'conflictRows': conflicts
+    }
+
+if __name__ == '__main__':
+    # python index.py links.jsonl [page_size] — массовая привязка при миграции со старого сайта;
+    # строка файла: {"user_id": 1, "provider": "vk", "providerId": "123", "email": ..., "data": {...}}
+    if len(sys.argv) < 2:
+        sys.exit('usage: python index.py <links.jsonl|-> [page_size]')
+    source = sys.stdin if sys.argv[1] == '-' else open(sys.argv[1], encoding='utf-8')
+    with source:
+        links = [json.loads(line) for line in source if line.strip()]
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else BULK_LINK_PAGE_SIZE
+    print(json.dumps(bulk_link_providers(links, page_size), ensure_ascii=False, indent=2))
@@ -0,0 +1,98 @@
+"""
+Concurrent double-spend test and benchmark for telegram-auth action=callback.
+
+Seeds fresh Telegram auth tokens and fires several callbacks per token at
+once. Exactly one callback per token may succeed; the rest must get 410
+"Token already used". Also reports callback latency and throughput.
+
+Usage:
+    DATABASE_URL=... MAIN_DB_SCHEMA=public \\
+        python benchmarks/callback_double_spend.py --tokens 300 --racers 4 --workers 32
+"""
+
+import argparse
+import json
+import os
+import secrets
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from common import load_handler, summarize
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--racers", type=int, default=4, help="concurrent callbacks per token")
+    parser.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args()
+
+    schema = os.environ.setdefault("MAIN_DB_SCHEMA", "public")
+    os.environ.setdefault("JWT_SECRET", secrets.token_hex(32))
+    os.environ.setdefault("DB_POOL_MAX_SIZE", str(args.workers))
+    tg_auth = load_handler("telegram-auth")
+
+    run_id = uuid.uuid4().hex[:8]
+    tokens = [str(uuid.uuid4()) for _ in range(args.tokens)]
+    conn = psycopg2.connect(os.environ["DATABASE_URL"], options=f"-c search_path={schema}")
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO telegram_auth_tokens (token_hash, telegram_id, telegram_first_name, expires_at)
+            VALUES %s
+        """, [
+            (tg_auth.hash_token(token), f"ds{run_id}{i % 50}", "Racer",
+             datetime.now(timezone.utc) + timedelta(minutes=30))
+            for i, token in enumerate(tokens)
+        ])
+    conn.commit()
+    conn.close()
+
+    def callback(token: str) -> tuple:
+        event = {
+            "httpMethod": "POST",
+            "queryStringParameters": {"action": "callback"},
+            "headers": {},
+            "body": json.dumps({"token": token}),
+        }
+        started = time.perf_counter()
+        response = tg_auth.handler(event, None)
+        return token, response["statusCode"], (time.perf_counter() - started) * 1000
+
+    jobs = [token for token in tokens for _ in range(args.racers)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(callback, jobs))
+    elapsed = time.perf_counter() - started
+
+    successes = defaultdict(int)
+    statuses = Counter()
+    for token, status, _ in results:
+        statuses[status] += 1
+        if status == 200:
+            successes[token] += 1
+
+    report = summarize([ms for _, _, ms in results], elapsed)
+    report.update({
+        "statuses": dict(statuses),
+        "double_spent": sum(1 for count in successes.values() if count > 1),
+        "never_exchanged": sum(1 for token in tokens if successes[token] == 0),
+    })
+    print(json.dumps(report, indent=2))
+
+    ok = (
+        report["double_spent"] == 0
+        and report["never_exchanged"] == 0
+        and set(statuses) <= {200, 410}
+    )
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
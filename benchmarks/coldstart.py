@@ -0,0 +1,110 @@
+"""
+Cold-start budget check for every backend function.
+
+For each function, a fresh interpreter imports index.py and serves one
+OPTIONS preflight. The script reports:
+
+- module import time;
+- first-invocation latency;
+- the top cumulative entries from `python -X importtime`;
+- which heavy dependencies were loaded along the way.
+
+It exits non-zero when import + first call exceeds the budget.
+
+Usage:
+    python benchmarks/coldstart.py --runs 5 --budget-ms 150
+    python benchmarks/coldstart.py --budget telegram-bot=250 --budget auth=200
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from common import FUNCTIONS, ROOT
+
+HEAVY_MODULES = ("psycopg2", "jwt", "telebot", "requests")
+
+PROBE = """
+import importlib.util, json, sys, time
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location("coldstart_probe", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+imported = time.perf_counter()
+response = module.handler({"httpMethod": "OPTIONS", "headers": {}, "queryStringParameters": {}}, None)
+finished = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_call_ms": (finished - imported) * 1000,
+    "status": response["statusCode"],
+    "loaded": [name for name in json.loads(sys.argv[2]) if name in sys.modules],
+}))
+"""
+
+
+def probe(path: str, importtime: bool = False) -> tuple:
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", PROBE, path, json.dumps(HEAVY_MODULES)]
+    result = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(path), check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def top_imports(stderr: str, limit: int) -> list:
+    """Parse `import time: self [us] | cumulative | package` lines into the slowest top-level imports."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, package = line[len("import time:"):].split("|")
+        if package.startswith(" ") and not package.startswith("  "):
+            entries.append((int(cumulative), package.strip()))
+    entries.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": round(us / 1000, 2)} for us, name in entries[:limit]]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per function")
+    parser.add_argument("--budget-ms", type=float, default=150, help="default import + first call budget")
+    parser.add_argument("--budget", action="append", default=[], metavar="NAME=MS",
+                        help="per-function budget override, repeatable")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports to list per function")
+    args = parser.parse_args()
+
+    budgets = {name: args.budget_ms for name in FUNCTIONS}
+    for override in args.budget:
+        name, _, value = override.partition("=")
+        if name not in FUNCTIONS:
+            parser.error(f"unknown function in --budget: {name}")
+        budgets[name] = float(value)
+
+    report = {}
+    over_budget = []
+    for name, relative in FUNCTIONS.items():
+        path = os.path.join(ROOT, relative)
+        samples = [probe(path)[0] for _ in range(args.runs)]
+        traced, stderr = probe(path, importtime=True)
+        cold_ms = statistics.median(s["import_ms"] + s["first_call_ms"] for s in samples)
+        report[name] = {
+            "import_ms": round(statistics.median(s["import_ms"] for s in samples), 2),
+            "first_call_ms": round(statistics.median(s["first_call_ms"] for s in samples), 2),
+            "cold_ms": round(cold_ms, 2),
+            "budget_ms": budgets[name],
+            "options_status": traced["status"],
+            "heavy_loaded": traced["loaded"],
+            "slowest_imports": top_imports(stderr, args.top),
+        }
+        if cold_ms > budgets[name]:
+            over_budget.append(name)
+
+    print(json.dumps({"functions": report, "over_budget": over_budget}, indent=2))
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
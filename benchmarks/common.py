@@ -0,0 +1,146 @@
+"""
+Shared helpers for the benchmark scripts: loading function handlers from
+their directories, latency statistics and a local fake Telegram Bot API.
+"""
+
+import importlib.util
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FUNCTIONS = {
+    "auth": "backend/auth/index.py",
+    "user-providers": "backend/user-providers/index.py",
+    "telegram-auth": "backend/extensions/telegram-bot/telegram-auth/index.py",
+    "telegram-bot": "backend/extensions/telegram-bot/telegram-bot/index.py",
+    "setup-webhook": "backend/extensions/telegram-bot/setup-webhook/index.py",
+}
+
+
+def load_handler(name: str):
+    """Import a function's index.py as an isolated module, like a fresh instance."""
+    path = os.path.join(ROOT, FUNCTIONS[name])
+    spec = importlib.util.spec_from_file_location(f"bench_{name.replace('-', '_')}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies_ms: list, elapsed: float) -> dict:
+    if not latencies_ms:
+        return {"requests": 0}
+    return {
+        "requests": len(latencies_ms),
+        "throughput_rps": round(len(latencies_ms) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(statistics.median(latencies_ms), 3),
+        "p95_ms": round(percentile(latencies_ms, 95), 3),
+        "p99_ms": round(percentile(latencies_ms, 99), 3),
+        "max_ms": round(max(latencies_ms), 3),
+    }
+
+
+def _chat_id(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class FakeTelegramApi:
+    """
+    Minimal stand-in for api.telegram.org: answers every Bot API method with
+    ok=true after an optional delay. Point functions at it with
+    TELEGRAM_API_URL=<base_url>.
+    """
+
+    def __init__(self, latency_ms: float = 0, rate_limit_every: int = 0, retry_after: int = 1):
+        self.latency_ms = latency_ms
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.calls = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeTelegramApi":
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._reply()
+
+            def do_POST(self):
+                self._reply()
+
+            def _reply(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                method = self.path.rstrip("/").rsplit("/", 1)[-1].split("?", 1)[0]
+                payload = api._parse(raw, self.headers.get("Content-Type", ""))
+                status, body = api.respond(method, payload)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @staticmethod
+    def _parse(raw: bytes, content_type: str) -> dict:
+        if not raw:
+            return {}
+        if "json" in content_type:
+            return json.loads(raw)
+        return dict(parse_qsl(raw.decode()))
+
+    def respond(self, method: str, payload: dict) -> tuple:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        with self._lock:
+            self.calls.append((method, payload))
+            count = len(self.calls)
+        if self.rate_limit_every and count % self.rate_limit_every == 0:
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        if method in ("sendMessage", "sendPhoto"):
+            return 200, {"ok": True, "result": {
+                "message_id": count,
+                "date": int(time.time()),
+                "chat": {"id": _chat_id(payload.get("chat_id")), "type": "private"},
+            }}
+        if method == "getWebhookInfo":
+            return 200, {"ok": True, "result": {"url": "", "pending_update_count": 0}}
+        return 200, {"ok": True, "result": True}
@@ -0,0 +1,300 @@
+"""
+In-process load test for all backend functions.
+
+Imports each function's handler(event, context) directly, seeds a local
+Postgres with synthetic users, sessions, providers and Telegram tokens, then
+drives every action concurrently and prints throughput and p50/p95/p99
+latency per action as JSON. Telegram Bot API calls go to a local fake server.
+
+Usage:
+    DATABASE_URL=postgresql://localhost/banya_bench MAIN_DB_SCHEMA=public \\
+        python benchmarks/loadtest.py --migrate --users 10000 --requests 2000 --concurrency 16
+
+    # subset of actions, report written to a file
+    python benchmarks/loadtest.py --actions auth.login,auth.verify --output bench.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import secrets
+import sys
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import psycopg2
+from psycopg2.extras import execute_values
+
+from common import ROOT, FakeTelegramApi, load_handler, summarize
+
+BENCH_PASSWORD = "bench-password"
+
+
+# =============================================================================
+# DATABASE SETUP
+# =============================================================================
+
+def connect(schema: str):
+    return psycopg2.connect(os.environ["DATABASE_URL"], options=f"-c search_path={schema}")
+
+
+def migrate(conn, schema: str) -> None:
+    """Apply db_migrations/*.sql to a fresh schema."""
+    with conn.cursor() as cur:
+        cur.execute("CREATE SCHEMA IF NOT EXISTS " + schema)
+        cur.execute("SELECT to_regclass(%s)", (f"{schema}.users",))
+        if cur.fetchone()[0]:
+            conn.commit()
+            return
+        for path in sorted(glob.glob(os.path.join(ROOT, "db_migrations", "*.sql"))):
+            with open(path, encoding="utf-8") as f:
+                cur.execute(f.read())
+    conn.commit()
+
+
+def seed(conn, args, modules: dict, run_id: str) -> dict:
+    """Create the rows every action needs and return handles to them."""
+    password_hash = modules["auth"].hash_password(BENCH_PASSWORD)
+    tg_auth = modules["telegram-auth"]
+    future = datetime.now() + timedelta(days=30)
+    state = {}
+
+    with conn.cursor() as cur:
+        rows = execute_values(cur, """
+            INSERT INTO users (email, password_hash, full_name) VALUES %s RETURNING id
+        """, [
+            (f"bench-{run_id}-{i}@example.com", password_hash, f"Bench User {i}")
+            for i in range(args.users)
+        ], page_size=1000, fetch=True)
+        user_ids = [row[0] for row in rows]
+        state["users"] = [(user_id, f"bench-{run_id}-{i}@example.com") for i, user_id in enumerate(user_ids)]
+
+        session_tokens = [f"bench-{run_id}-session-{i}" for i in range(args.users)]
+        execute_values(cur, "INSERT INTO sessions (user_id, token_hash, expires_at) VALUES %s", [
+            (user_id, modules["auth"].hash_token(token), future) for user_id, token in zip(user_ids, session_tokens)
+        ], page_size=1000)
+        state["sessions"] = session_tokens
+
+        execute_values(cur, """
+            INSERT INTO user_providers (user_id, provider, provider_user_id, provider_email) VALUES %s
+        """, [
+            (user_id, "email", f"{run_id}-{user_id}", email) for user_id, email in state["users"]
+        ], page_size=1000)
+
+        rows = execute_values(cur, """
+            INSERT INTO users (telegram_id, email, full_name, password_hash, email_verified)
+            VALUES %s RETURNING id
+        """, [
+            (f"{run_id}{i}", f"telegram_{run_id}{i}@bench.local", f"Telegram {i}", "", True)
+            for i in range(args.telegram_users)
+        ], page_size=1000, fetch=True)
+        telegram_user_ids = [row[0] for row in rows]
+
+        refresh_tokens = [secrets.token_urlsafe(48) for _ in range(args.requests * 2)]
+        execute_values(cur, "INSERT INTO refresh_tokens (user_id, token_hash, expires_at) VALUES %s", [
+            (telegram_user_ids[i % len(telegram_user_ids)], tg_auth.hash_token(token), future)
+            for i, token in enumerate(refresh_tokens)
+        ], page_size=1000)
+        state["refresh_tokens"] = refresh_tokens[:args.requests]
+        state["logout_tokens"] = refresh_tokens[args.requests:]
+
+        auth_tokens = [str(uuid.uuid4()) for _ in range(args.requests)]
+        execute_values(cur, """
+            INSERT INTO telegram_auth_tokens (token_hash, telegram_id, telegram_first_name, expires_at)
+            VALUES %s
+        """, [
+            (tg_auth.hash_token(token), f"{run_id}{i % args.telegram_users}", f"Telegram {i}",
+             datetime.now(timezone.utc) + timedelta(minutes=30))
+            for i, token in enumerate(auth_tokens)
+        ], page_size=1000)
+        state["auth_tokens"] = auth_tokens
+
+    conn.commit()
+    return state
+
+
+# =============================================================================
+# SYNTHETIC EVENTS
+# =============================================================================
+
+def http_event(method: str, action: str = "", body=None, headers=None) -> dict:
+    return {
+        "httpMethod": method,
+        "queryStringParameters": {"action": action} if action else {},
+        "headers": headers or {},
+        "body": json.dumps(body) if body is not None else "",
+    }
+
+
+def build_actions(state: dict, run_id: str, jwt_secret: str) -> dict:
+    """Map action name -> (function name, event factory taking a request index)."""
+    users = state["users"]
+    rng = random.Random(run_id)
+
+    def access_token(user_id: int) -> str:
+        exp = datetime.now(timezone.utc) + timedelta(minutes=15)
+        return jwt.encode({"user_id": user_id, "exp": exp}, jwt_secret, algorithm="HS256")
+
+    def bearer(user_id: int) -> dict:
+        return {"X-Authorization": f"Bearer {access_token(user_id)}"}
+
+    def update(i: int, text: str) -> dict:
+        sender = {"id": 10_000_000 + i, "first_name": "Bench", "username": f"bench{i}"}
+        return http_event("POST", body={
+            "update_id": int(time.time()) * 100_000 + i,
+            "message": {"message_id": i, "date": int(time.time()), "text": text,
+                        "from": sender, "chat": {"id": sender["id"], "type": "private"}},
+        })
+
+    return {
+        "auth.register": ("auth", lambda i: http_event("POST", "register", {
+            "email": f"bench-{run_id}-new-{i}@example.com",
+            "password": BENCH_PASSWORD,
+            "full_name": "Bench Signup",
+        })),
+        "auth.login": ("auth", lambda i: http_event("POST", "login", {
+            "email": rng.choice(users)[1], "password": BENCH_PASSWORD,
+        })),
+        "auth.verify": ("auth", lambda i: http_event("GET", "verify", headers={
+            "X-Authorization": f"Bearer {rng.choice(state['sessions'])}",
+        })),
+        "providers.list": ("user-providers", lambda i: http_event(
+            "GET", headers=bearer(rng.choice(users)[0]))),
+        "providers.link": ("user-providers", lambda i: http_event(
+            "POST", body={"provider": "vk", "providerId": f"{run_id}-vk-{i}"},
+            headers=bearer(users[i % len(users)][0]))),
+        "providers.unlink": ("user-providers", lambda i: {
+            **http_event("DELETE", headers=bearer(users[i % len(users)][0])),
+            "queryStringParameters": {"provider": "vk"},
+        }),
+        "telegram.callback": ("telegram-auth", lambda i: http_event(
+            "POST", "callback", {"token": state["auth_tokens"][i]})),
+        "telegram.refresh": ("telegram-auth", lambda i: http_event(
+            "POST", "refresh", {"refresh_token": state["refresh_tokens"][i]})),
+        "telegram.logout": ("telegram-auth", lambda i: http_event(
+            "POST", "logout", {"refresh_token": state["logout_tokens"][i]})),
+        "bot.webhook_start": ("telegram-bot", lambda i: update(i, "/start web_auth")),
+        "bot.webhook_text": ("telegram-bot", lambda i: update(i, "hello")),
+        "bot.send": ("telegram-bot", lambda i: http_event(
+            "POST", "send", {"chat_id": str(10_000_000 + i), "text": f"Bench notification {i}"})),
+        "bot.enqueue": ("telegram-bot", lambda i: http_event(
+            "POST", "send", {"chat_id": str(10_000_000 + i), "text": f"Queued {i}", "queue": True})),
+        "bot.drain_outbox": ("telegram-bot", lambda i: http_event(
+            "POST", "drain-outbox", {}, {"X-Worker-Secret": os.environ["WORKER_SECRET"]})),
+        "bot.process_updates": ("telegram-bot", lambda i: http_event(
+            "POST", "process-updates", {}, {"X-Worker-Secret": os.environ["WORKER_SECRET"]})),
+        "setup.info": ("setup-webhook", lambda i: http_event("GET", "info")),
+    }
+
+
+# =============================================================================
+# RUNNER
+# =============================================================================
+
+def run_action(module, make_event, requests: int, concurrency: int) -> dict:
+    events = [make_event(i) for i in range(requests)]
+
+    def call(event: dict) -> tuple:
+        started = time.perf_counter()
+        try:
+            status = module.handler(event, None).get("statusCode", 0)
+        except Exception:
+            status = "exception"
+        return status, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, events))
+    elapsed = time.perf_counter() - started
+
+    statuses = Counter(str(status) for status, _ in results)
+    report = summarize([ms for _, ms in results], elapsed)
+    report["statuses"] = dict(statuses)
+    # 503 carries Retry-After: deliberate load shedding, reported apart from failures
+    report["shed"] = statuses.get("503", 0)
+    report["errors"] = sum(count for status, count in statuses.items()
+                           if status == "exception" or (status.startswith("5") and status != "503"))
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000, help="email/password users to seed")
+    parser.add_argument("--telegram-users", type=int, default=200, help="Telegram users to seed")
+    parser.add_argument("--requests", type=int, default=500, help="requests per action")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent callers")
+    parser.add_argument("--actions", default="", help="comma-separated subset of actions")
+    parser.add_argument("--telegram-latency-ms", type=float, default=0, help="fake Bot API delay")
+    parser.add_argument("--migrate", action="store_true", help="apply db_migrations to a fresh schema")
+    parser.add_argument("--output", default="", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    schema = os.environ.setdefault("MAIN_DB_SCHEMA", "public")
+    jwt_secret = os.environ.setdefault("JWT_SECRET", secrets.token_hex(32))
+    fake_api = FakeTelegramApi(latency_ms=args.telegram_latency_ms).start()
+    os.environ["TELEGRAM_API_URL"] = fake_api.base_url
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:bench")
+    os.environ.setdefault("SITE_URL", "https://bench.local")
+    os.environ.setdefault("WORKER_SECRET", secrets.token_hex(32))
+    os.environ.setdefault("DB_POOL_MAX_SIZE", str(args.concurrency))
+    # the load test hammers a few hundred emails on purpose; measure the handlers, not the throttle
+    os.environ.setdefault("THROTTLE_EMAIL_LIMIT", "1000000000")
+
+    conn = connect(schema)
+    if args.migrate:
+        migrate(conn, schema)
+
+    modules = {name: load_handler(name) for name in
+               ("auth", "user-providers", "telegram-auth", "telegram-bot", "setup-webhook")}
+    run_id = uuid.uuid4().hex[:8]
+    seed_started = time.perf_counter()
+    state = seed(conn, args, modules, run_id)
+    conn.close()
+
+    actions = build_actions(state, run_id, jwt_secret)
+    selected = [name.strip() for name in args.actions.split(",") if name.strip()] or list(actions)
+    unknown = [name for name in selected if name not in actions]
+    if unknown:
+        parser.error(f"unknown actions: {', '.join(unknown)}")
+
+    report = {
+        "config": {
+            "users": args.users,
+            "telegram_users": args.telegram_users,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "telegram_latency_ms": args.telegram_latency_ms,
+            "seed_seconds": round(time.perf_counter() - seed_started, 2),
+        },
+        "actions": {},
+    }
+    for name in selected:
+        function, make_event = actions[name]
+        report["actions"][name] = run_action(modules[function], make_event, args.requests, args.concurrency)
+
+    report["pools"] = {
+        name: module.get_pool_stats()
+        for name, module in modules.items() if hasattr(module, "get_pool_stats")
+    }
+    report["admission"] = {
+        name: module.get_admission_stats()
+        for name, module in modules.items() if hasattr(module, "get_admission_stats")
+    }
+    fake_api.stop()
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+    return 1 if any(result["errors"] for result in report["actions"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Parse/plan savings of server-side prepared statements on the hottest lookups.
+
+Runs each statement from the functions' PREPARED_STATEMENTS registries
+through the function's own connection pool at high concurrency, once as a
+plain parameterized query and once through execute_prepared(). Each query
+is a checkout, one lookup and a release, like a warm request. The report
+gives throughput and latency for both modes.
+
+Usage:
+    DATABASE_URL=... MAIN_DB_SCHEMA=public \\
+        python benchmarks/prepared_statements.py --queries 20000 --concurrency 16
+"""
+
+import argparse
+import json
+import os
+import secrets
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import psycopg2
+
+from common import load_handler, summarize
+
+
+def seed(schema: str, tg_auth) -> dict:
+    run_id = uuid.uuid4().hex[:8]
+    session_token = secrets.token_urlsafe(32)
+    refresh_token = secrets.token_urlsafe(48)
+    future = datetime.now() + timedelta(days=1)
+    conn = psycopg2.connect(os.environ["DATABASE_URL"], options=f"-c search_path={schema}")
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO users (email, password_hash, full_name, telegram_id)
+            VALUES (%s, '', 'Prepared Bench', %s) RETURNING id
+        """, (f"prepared-{run_id}@example.com", f"prep{run_id}"))
+        user_id = cur.fetchone()[0]
+        cur.execute("INSERT INTO sessions (user_id, token_hash, expires_at) VALUES (%s, %s, %s)",
+                    (user_id, tg_auth.hash_token(session_token), future))
+        cur.execute("INSERT INTO refresh_tokens (user_id, token_hash, expires_at) VALUES (%s, %s, %s)",
+                    (user_id, tg_auth.hash_token(refresh_token), future))
+        cur.execute("""
+            INSERT INTO user_providers (user_id, provider, provider_user_id) VALUES (%s, 'email', %s)
+        """, (user_id, f"prep-{run_id}"))
+    conn.commit()
+    conn.close()
+    return {
+        "auth_verify_session": (tg_auth.hash_token(session_token),),
+        "tg_refresh_user": (tg_auth.hash_token(refresh_token),),
+        "providers_list": (user_id,),
+    }
+
+
+def run(module, name: str, params: tuple, prepared: bool, queries: int, concurrency: int) -> dict:
+    # auth relies on search_path, the other functions prefix the schema themselves
+    schema = module.get_schema() if hasattr(module, "get_schema") else ""
+    plain_sql = module.PREPARED_STATEMENTS[name].format(schema=schema).replace("$1", "%s")
+
+    def lookup(_: int) -> float:
+        started = time.perf_counter()
+        conn = module.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if prepared:
+                module.execute_prepared(cursor, name, params)
+            else:
+                cursor.execute(plain_sql, params)
+            cursor.fetchall()
+            cursor.close()
+        finally:
+            module.release_db_connection(conn)
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(lookup, range(queries)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=20_000, help="lookups per statement and mode")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    schema = os.environ.setdefault("MAIN_DB_SCHEMA", "public")
+    os.environ.setdefault("DB_POOL_MAX_SIZE", str(args.concurrency))
+    modules = {
+        "auth_verify_session": load_handler("auth"),
+        "tg_refresh_user": load_handler("telegram-auth"),
+        "providers_list": load_handler("user-providers"),
+    }
+    params = seed(schema, modules["tg_refresh_user"])
+
+    report = {"config": {"queries": args.queries, "concurrency": args.concurrency}, "statements": {}}
+    for name, module in modules.items():
+        plain = run(module, name, params[name], False, args.queries, args.concurrency)
+        prepared = run(module, name, params[name], True, args.queries, args.concurrency)
+        report["statements"][name] = {
+            "plain": plain,
+            "prepared": prepared,
+            "throughput_gain": round(prepared["throughput_rps"] / plain["throughput_rps"], 2),
+            "pool": module.get_pool_stats(),
+        }
+
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
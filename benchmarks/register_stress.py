@@ -0,0 +1,96 @@
+"""
+Concurrent sign-up stress test for the auth function.
+
+Fires many registrations at once, with several requests racing for each
+email, and checks that every email gets exactly one 201 and the rest 409.
+No request may fail with 500 (e.g. a unique-violation from a racy pre-check).
+The password hash queue is sized to the worker count. A 503 from a full
+queue is deliberate backpressure, so it is retried after Retry-After and
+counted separately.
+
+Usage:
+    DATABASE_URL=... MAIN_DB_SCHEMA=public \\
+        python benchmarks/register_stress.py --emails 200 --racers 4 --workers 32
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from common import load_handler, percentile
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=200, help="distinct emails to register")
+    parser.add_argument("--racers", type=int, default=4, help="concurrent requests per email")
+    parser.add_argument("--workers", type=int, default=32, help="client threads")
+    parser.add_argument("--retries", type=int, default=5, help="retries of a 503 per request")
+    args = parser.parse_args()
+
+    # every worker may be hashing at once; racers for one email must not trip the login throttle
+    os.environ.setdefault("PASSWORD_HASH_QUEUE_LIMIT", str(args.workers))
+    os.environ.setdefault("THROTTLE_EMAIL_LIMIT", str(args.racers * (args.retries + 1)))
+    auth = load_handler("auth")
+    run_id = uuid.uuid4().hex[:8]
+    emails = [f"stress-{run_id}-{i}@example.com" for i in range(args.emails)]
+    jobs = [email for email in emails for _ in range(args.racers)]
+
+    def register(email: str) -> tuple:
+        event = {
+            "httpMethod": "POST",
+            "queryStringParameters": {"action": "register"},
+            "headers": {},
+            "body": json.dumps({"email": email, "password": "stress-password", "full_name": "Stress"}),
+        }
+        started = time.perf_counter()
+        retried = 0
+        response = auth.handler(event, None)
+        while response["statusCode"] == 503 and retried < args.retries:
+            retried += 1
+            time.sleep(float(response["headers"].get("Retry-After", 1)))
+            response = auth.handler(event, None)
+        return email, response["statusCode"], (time.perf_counter() - started) * 1000, retried
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(register, jobs))
+    elapsed = time.perf_counter() - started
+
+    created = defaultdict(int)
+    statuses = Counter()
+    for email, status, _, _ in results:
+        statuses[status] += 1
+        if status == 201:
+            created[email] += 1
+
+    latencies = [ms for _, _, ms, _ in results]
+    report = {
+        "requests": len(results),
+        "statuses": dict(statuses),
+        "duplicates": sum(1 for count in created.values() if count > 1),
+        "missing": sum(1 for email in emails if created[email] == 0),
+        "retried_503": sum(retried for _, _, _, retried in results),
+        "throughput_rps": round(len(results) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+    print(json.dumps(report, indent=2))
+
+    ok = (
+        report["duplicates"] == 0
+        and report["missing"] == 0
+        and set(statuses) <= {201, 409}
+    )
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
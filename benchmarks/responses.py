@@ -0,0 +1,89 @@
+"""
+Per-response overhead of the response helpers in every function.
+
+Builds a typical success body and an error envelope through each function's
+json_response/error_response, once with orjson (when installed) and once
+with the stdlib fallback, and compares them with the hand-built dict +
+json.dumps responses the handlers used to return. No database is needed.
+
+Usage:
+    python benchmarks/responses.py --iterations 100000
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from common import FUNCTIONS, load_handler
+
+SUCCESS_BODY = {
+    "message": "Вход выполнен",
+    "token": "x" * 64,
+    "user": {"id": 123456, "email": "user@example.com", "full_name": "Иван Банщиков"},
+    "providers": [{"provider": p, "providerId": f"{p}-1", "linkedAt": "2026-01-01T00:00:00"}
+                  for p in ("email", "telegram", "vk")],
+}
+
+
+def legacy_success() -> dict:
+    return {
+        "statusCode": 200,
+        "headers": {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
+        "body": json.dumps(SUCCESS_BODY),
+        "isBase64Encoded": False,
+    }
+
+
+def legacy_error() -> dict:
+    return {
+        "statusCode": 401,
+        "headers": {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
+        "body": json.dumps({"error": "Неверный email или пароль"}),
+        "isBase64Encoded": False,
+    }
+
+
+def per_call_ns(fn, iterations: int) -> float:
+    started = time.perf_counter_ns()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter_ns() - started) / iterations
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    report = {
+        "iterations": args.iterations,
+        "legacy": {
+            "success_ns": round(per_call_ns(legacy_success, args.iterations)),
+            "error_ns": round(per_call_ns(legacy_error, args.iterations)),
+        },
+        "functions": {},
+    }
+    for name in FUNCTIONS:
+        module = load_handler(name)
+        fast = module.orjson
+        results = {}
+        for label, backend in (("orjson", fast), ("stdlib", None)):
+            if label == "orjson" and fast is None:
+                continue
+            module.orjson = backend
+            assert json.loads(module.json_response(200, SUCCESS_BODY)["body"]) == SUCCESS_BODY
+            results[label] = {
+                "success_ns": round(per_call_ns(lambda: module.json_response(200, SUCCESS_BODY), args.iterations)),
+                "error_ns": round(per_call_ns(
+                    lambda: module.error_response(401, "Неверный email или пароль"), args.iterations)),
+            }
+        module.orjson = fast
+        report["functions"][name] = results
+
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
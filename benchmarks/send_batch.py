@@ -0,0 +1,74 @@
+"""
+Exercise telegram-bot's action=send-batch against the local fake Bot API.
+
+The fake server answers every Nth call with 429 + retry_after, so the run
+checks that the sender backs off, retries and still delivers to every
+recipient while staying under the configured global rate.
+
+Usage:
+    python benchmarks/send_batch.py --recipients 200 --rate-limit-every 50 --latency-ms 20
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from common import FakeTelegramApi, load_handler
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipients", type=int, default=200)
+    parser.add_argument("--duplicates", type=int, default=5, help="recipients that appear twice")
+    parser.add_argument("--rate-limit-every", type=int, default=50, help="answer every Nth call with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    fake_api = FakeTelegramApi(
+        latency_ms=args.latency_ms,
+        rate_limit_every=args.rate_limit_every,
+        retry_after=args.retry_after,
+    ).start()
+    os.environ["TELEGRAM_API_URL"] = fake_api.base_url
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:bench")
+    os.environ.setdefault("BATCH_MAX_RECIPIENTS", str(args.recipients + args.duplicates))
+    bot = load_handler("telegram-bot")
+
+    chat_ids = [str(20_000_000 + i) for i in range(args.recipients)]
+    chat_ids += chat_ids[:args.duplicates]
+    event = {
+        "httpMethod": "POST",
+        "queryStringParameters": {"action": "send-batch"},
+        "headers": {},
+        "body": json.dumps({"chat_ids": chat_ids, "text": "Batch notification"}),
+    }
+
+    started = time.perf_counter()
+    response = bot.handler(event, None)
+    elapsed = time.perf_counter() - started
+    fake_api.stop()
+
+    body = json.loads(response["body"])
+    sends = [call for call in fake_api.calls if call[0] == "sendMessage"]
+    report = {
+        "status": response["statusCode"],
+        "recipients": len(chat_ids),
+        "sent": body.get("sent"),
+        "failed": body.get("failed"),
+        "api_calls": len(sends),
+        "rate_limited": len(sends) - (body.get("sent") or 0) - (body.get("failed") or 0),
+        "seconds": round(elapsed, 2),
+        "effective_rate": round(len(sends) / elapsed, 1),
+        "configured_rate": bot.BATCH_GLOBAL_RATE,
+    }
+    print(json.dumps(report, indent=2))
+
+    ok = response["statusCode"] == 200 and body.get("failed") == 0
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Index size and lookup latency of token keys stored as text vs 32-byte bytea.
+
+Builds three throwaway tables in a scratch schema with the same --rows
+tokens, each keyed the way a migration generation stored them:
+
+- raw: the 43-character url-safe token as VARCHAR(255) (old sessions.token);
+- hex: the 64-character hex SHA-256 as VARCHAR(64) (old token_hash columns);
+- bytea: the 32-byte SHA-256 digest (current schema).
+
+Rows are generated server-side. The report gives the unique index and heap
+size of each table, then p50/p95/p99 of point lookups by key with random
+probes. The scratch schema is dropped at the end unless --keep is given.
+
+Usage:
+    DATABASE_URL=... python benchmarks/token_keys.py --rows 10000000 --lookups 50000
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+
+import psycopg2
+
+from common import summarize
+
+SCRATCH_SCHEMA = "bench_token_keys"
+
+# key column type and SQL expression that derives the key from the digest `d`
+VARIANTS = {
+    "raw": ("VARCHAR(255)", "rtrim(translate(encode(d, 'base64'), '+/', '-_'), '=')"),
+    "hex": ("VARCHAR(64)", "encode(d, 'hex')"),
+    "bytea": ("BYTEA", "d"),
+}
+
+
+def digest(i: int) -> bytes:
+    return hashlib.sha256(f"token-{i}".encode()).digest()
+
+
+def client_key(variant: str, i: int):
+    """The same key the server generated for row i, as the functions would pass it."""
+    d = digest(i)
+    if variant == "raw":
+        return base64.urlsafe_b64encode(d).rstrip(b"=").decode()
+    if variant == "hex":
+        return d.hex()
+    return d
+
+
+def build(cur, variant: str, rows: int) -> float:
+    column_type, key_sql = VARIANTS[variant]
+    started = time.perf_counter()
+    cur.execute(f"""
+        CREATE TABLE {SCRATCH_SCHEMA}.{variant} (
+            id BIGINT NOT NULL,
+            token_key {column_type} NOT NULL,
+            expires_at TIMESTAMP NOT NULL
+        )
+    """)
+    cur.execute(f"""
+        INSERT INTO {SCRATCH_SCHEMA}.{variant} (id, token_key, expires_at)
+        SELECT i, {key_sql}, NOW() + INTERVAL '30 days'
+        FROM generate_series(1, %s) AS i,
+             LATERAL (SELECT sha256(convert_to('token-' || i, 'UTF8')) AS d) AS k
+    """, (rows,))
+    cur.execute(f"CREATE UNIQUE INDEX {variant}_key ON {SCRATCH_SCHEMA}.{variant} (token_key)")
+    cur.execute(f"VACUUM ANALYZE {SCRATCH_SCHEMA}.{variant}")
+    return time.perf_counter() - started
+
+
+def sizes(cur, variant: str) -> dict:
+    table = f"{SCRATCH_SCHEMA}.{variant}"
+    cur.execute(f"""
+        SELECT pg_relation_size(%s::regclass), pg_relation_size(%s::regclass),
+               (SELECT avg(pg_column_size(token_key)) FROM {table})
+    """, (f"{table}_key", table))
+    index_bytes, heap_bytes, key_bytes = cur.fetchone()
+    return {
+        "index_mb": round(index_bytes / 2 ** 20, 1),
+        "heap_mb": round(heap_bytes / 2 ** 20, 1),
+        "avg_key_bytes": round(float(key_bytes), 1),
+    }
+
+
+def lookups(cur, variant: str, rows: int, count: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    probes = [client_key(variant, rng.randint(1, rows)) for _ in range(count)]
+    sql = f"SELECT id, expires_at FROM {SCRATCH_SCHEMA}.{variant} WHERE token_key = %s"
+    for key in probes[:min(count, 1000)]:
+        cur.execute(sql, (key,))
+        cur.fetchone()
+
+    latencies = []
+    misses = 0
+    started = time.perf_counter()
+    for key in probes:
+        probe_started = time.perf_counter()
+        cur.execute(sql, (key,))
+        if cur.fetchone() is None:
+            misses += 1
+        latencies.append((time.perf_counter() - probe_started) * 1000)
+    report = summarize(latencies, time.perf_counter() - started)
+    report["misses"] = misses
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--lookups", type=int, default=50_000, help="point lookups per variant")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="leave the scratch schema in place")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    conn.autocommit = True
+    report = {"config": {"rows": args.rows, "lookups": args.lookups}, "variants": {}}
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCRATCH_SCHEMA} CASCADE")
+            cur.execute(f"CREATE SCHEMA {SCRATCH_SCHEMA}")
+            for variant in VARIANTS:
+                build_s = build(cur, variant, args.rows)
+                report["variants"][variant] = {
+                    "column_type": VARIANTS[variant][0],
+                    "build_s": round(build_s, 1),
+                    **sizes(cur, variant),
+                    "lookup": lookups(cur, variant, args.rows, args.lookups, args.seed),
+                }
+            if not args.keep:
+                cur.execute(f"DROP SCHEMA {SCRATCH_SCHEMA} CASCADE")
+    finally:
+        conn.close()
+
+    variants = report["variants"]
+    report["bytea_vs_hex"] = {
+        "index_size_ratio": round(variants["bytea"]["index_mb"] / variants["hex"]["index_mb"], 2),
+        "p50_ratio": round(variants["bytea"]["lookup"]["p50_ms"] / variants["hex"]["lookup"]["p50_ms"], 2),
+    }
+    report["bytea_vs_raw"] = {
+        "index_size_ratio": round(variants["bytea"]["index_mb"] / variants["raw"]["index_mb"], 2),
+        "p50_ratio": round(variants["bytea"]["lookup"]["p50_ms"] / variants["raw"]["lookup"]["p50_ms"], 2),
+    }
+    print(json.dumps(report, indent=2))
+    return 0 if all(v["lookup"]["misses"] == 0 for v in variants.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
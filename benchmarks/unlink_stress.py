@@ -0,0 +1,120 @@
+"""
+Concurrent unlink stress test for user-providers DELETE.
+
+Seeds users with several linked providers each and fires DELETE for every
+provider of a user at the same time. Exactly one provider per user must
+survive: all but one request get 200, the rest 400 "Cannot unlink last
+provider". No request may fail with 500. Also reports unlink latency.
+
+Usage:
+    DATABASE_URL=... MAIN_DB_SCHEMA=public \\
+        python benchmarks/unlink_stress.py --users 200 --providers 4 --workers 32
+"""
+
+import argparse
+import json
+import os
+import secrets
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import psycopg2
+from psycopg2.extras import execute_values
+
+from common import load_handler, summarize
+
+PROVIDERS = ["email", "telegram", "vk", "google", "yandex"]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--providers", type=int, default=4, help=f"links per user, at most {len(PROVIDERS)}")
+    parser.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args()
+    if not 2 <= args.providers <= len(PROVIDERS):
+        parser.error(f"--providers must be between 2 and {len(PROVIDERS)}")
+
+    schema = os.environ.setdefault("MAIN_DB_SCHEMA", "public")
+    secret = os.environ.setdefault("JWT_SECRET", secrets.token_hex(32))
+    os.environ.setdefault("DB_POOL_MAX_SIZE", str(args.workers))
+    providers = load_handler("user-providers")
+
+    run_id = uuid.uuid4().hex[:8]
+    conn = psycopg2.connect(os.environ["DATABASE_URL"], options=f"-c search_path={schema}")
+    with conn.cursor() as cur:
+        rows = execute_values(cur, "INSERT INTO users (email, password_hash, full_name) VALUES %s RETURNING id", [
+            (f"unlink-{run_id}-{i}@example.com", "", "Unlink Stress") for i in range(args.users)
+        ], fetch=True)
+        user_ids = [row[0] for row in rows]
+        execute_values(cur, "INSERT INTO user_providers (user_id, provider, provider_user_id) VALUES %s", [
+            (user_id, provider, f"{run_id}-{provider}-{user_id}")
+            for user_id in user_ids for provider in PROVIDERS[:args.providers]
+        ], page_size=1000)
+    conn.commit()
+
+    exp = datetime.now(timezone.utc) + timedelta(minutes=15)
+    tokens = {user_id: jwt.encode({"user_id": user_id, "exp": exp}, secret, algorithm="HS256") for user_id in user_ids}
+
+    def unlink(job: tuple) -> tuple:
+        user_id, provider = job
+        event = {
+            "httpMethod": "DELETE",
+            "queryStringParameters": {"provider": provider},
+            "headers": {"X-Authorization": f"Bearer {tokens[user_id]}"},
+            "body": "",
+        }
+        started = time.perf_counter()
+        response = providers.handler(event, None)
+        return user_id, response["statusCode"], (time.perf_counter() - started) * 1000
+
+    jobs = [(user_id, provider) for user_id in user_ids for provider in PROVIDERS[:args.providers]]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(unlink, jobs))
+    elapsed = time.perf_counter() - started
+
+    unlinked = defaultdict(int)
+    statuses = Counter()
+    for user_id, status, _ in results:
+        statuses[status] += 1
+        if status == 200:
+            unlinked[user_id] += 1
+
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT COUNT(*) FILTER (WHERE remaining <> 1) FROM (
+                SELECT u.id, COUNT(p.id) AS remaining
+                FROM users u LEFT JOIN user_providers p ON p.user_id = u.id
+                WHERE u.id = ANY(%s)
+                GROUP BY u.id
+            ) counts
+        """, (user_ids,))
+        wrong_remaining = cur.fetchone()[0]
+    conn.close()
+
+    report = summarize([ms for _, _, ms in results], elapsed)
+    report.update({
+        "statuses": dict(statuses),
+        "users_without_exactly_one_link": wrong_remaining,
+        "users_with_wrong_unlink_count": sum(
+            1 for user_id in user_ids if unlinked[user_id] != args.providers - 1
+        ),
+    })
+    print(json.dumps(report, indent=2))
+
+    ok = (
+        wrong_remaining == 0
+        and report["users_with_wrong_unlink_count"] == 0
+        and set(statuses) <= {200, 400}
+    )
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+-- Очередь исходящих уведомлений Telegram (outbox)
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL,
+    chat_id VARCHAR(64) NOT NULL,
+    payload JSONB NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    message_id BIGINT,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+-- Воркеры выбирают только готовые к отправке записи, индекс покрывает лишь их
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_due
+    ON notification_outbox(next_attempt_at)
+    WHERE status IN ('pending', 'sending');
+
+COMMENT ON TABLE notification_outbox IS 'Исходящие уведомления Telegram, доставляемые воркерами';
+COMMENT ON COLUMN notification_outbox.kind IS 'Тип отправки: message или photo';
+COMMENT ON COLUMN notification_outbox.status IS 'pending, sending (захвачено воркером до next_attempt_at), sent, failed';
+COMMENT ON COLUMN notification_outbox.next_attempt_at IS 'Время следующей попытки или окончания аренды воркера';
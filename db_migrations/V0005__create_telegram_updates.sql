@@ -0,0 +1,23 @@
+-- Входящие обновления Telegram: webhook сохраняет их и сразу отвечает 200,
+-- обработка выполняется отдельно. Первичный ключ по update_id отсекает повторы.
+CREATE TABLE IF NOT EXISTS telegram_updates (
+    update_id BIGINT PRIMARY KEY,
+    payload JSONB NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_telegram_updates_due
+    ON telegram_updates(next_attempt_at)
+    WHERE status IN ('pending', 'processing');
+
+CREATE INDEX IF NOT EXISTS idx_telegram_updates_processed
+    ON telegram_updates(processed_at)
+    WHERE status IN ('processed', 'failed');
+
+COMMENT ON TABLE telegram_updates IS 'Журнал входящих обновлений Telegram для дедупликации и отложенной обработки';
+COMMENT ON COLUMN telegram_updates.status IS 'pending, processing (захвачено до next_attempt_at), processed, failed';
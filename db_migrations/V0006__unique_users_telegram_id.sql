@@ -0,0 +1,32 @@
+-- Уникальный индекс по telegram_id нужен для INSERT ... ON CONFLICT (telegram_id)
+-- при обмене токена авторизации; NULL у пользователей без Telegram допустимы
+
+-- Прежняя проверка-затем-вставка могла создать дубли telegram_id. На них CREATE UNIQUE INDEX
+-- падает с малопонятной ошибкой, а за ним и все следующие миграции. Дубли привязаны к сессиям,
+-- refresh-токенам и провайдерам, поэтому автоматически не сливаются: миграция останавливается
+-- со списком, аккаунты нужно объединить вручную и запустить её повторно
+DO $$
+DECLARE
+    duplicates TEXT;
+BEGIN
+    SELECT string_agg(format('%s (users.id: %s)', telegram_id, ids), '; ')
+    INTO duplicates
+    FROM (
+        SELECT telegram_id, string_agg(id::text, ', ' ORDER BY id) AS ids
+        FROM users
+        WHERE telegram_id IS NOT NULL
+        GROUP BY telegram_id
+        HAVING COUNT(*) > 1
+    ) AS d;
+
+    IF duplicates IS NOT NULL THEN
+        RAISE EXCEPTION 'users.telegram_id has duplicates, unique index cannot be created: %', duplicates
+            USING HINT = 'Merge each group into one account (move sessions, refresh_tokens and user_providers '
+                         'to the account that stays, clear telegram_id on the rest), then rerun this migration.';
+    END IF;
+END $$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_users_telegram_id ON users(telegram_id);
+
+-- Обычный индекс стал избыточным
+DROP INDEX IF EXISTS idx_users_telegram_id;
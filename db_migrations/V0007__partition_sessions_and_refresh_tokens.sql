@@ -0,0 +1,76 @@
+-- Сессии и refresh-токены секционируются по expires_at понедельно: истёкшая неделя
+-- удаляется целиком (DROP секции) вместо DELETE с последующим VACUUM, а индексы
+-- живых секций остаются маленькими. Новые секции создаёт и старые удаляет
+-- POST ?action=maintenance функции auth. Ключи секционированной таблицы обязаны
+-- включать expires_at.
+
+ALTER TABLE sessions RENAME TO sessions_unpartitioned;
+ALTER TABLE refresh_tokens RENAME TO refresh_tokens_unpartitioned;
+
+CREATE TABLE sessions (
+    id INTEGER NOT NULL DEFAULT nextval('sessions_id_seq'),
+    user_id INTEGER NOT NULL,
+    token VARCHAR(255) NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT pk_sessions PRIMARY KEY (id, expires_at),
+    CONSTRAINT uq_sessions_token UNIQUE (token, expires_at),
+    CONSTRAINT fk_sessions_user FOREIGN KEY (user_id) REFERENCES users(id)
+) PARTITION BY RANGE (expires_at);
+
+CREATE TABLE refresh_tokens (
+    id INTEGER NOT NULL DEFAULT nextval('refresh_tokens_id_seq'),
+    user_id INTEGER NOT NULL,
+    token_hash VARCHAR(64) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    revoked BOOLEAN DEFAULT FALSE,
+    CONSTRAINT pk_refresh_tokens PRIMARY KEY (id, expires_at),
+    CONSTRAINT uq_refresh_tokens_hash UNIQUE (token_hash, expires_at)
+) PARTITION BY RANGE (expires_at);
+
+-- Недельные секции с текущей недели на 9 недель вперёд (дольше 30-дневного срока жизни)
+DO $$
+DECLARE
+    parent TEXT;
+    week DATE;
+BEGIN
+    FOREACH parent IN ARRAY ARRAY['sessions', 'refresh_tokens'] LOOP
+        week := date_trunc('week', CURRENT_DATE)::date;
+        WHILE week < CURRENT_DATE + 63 LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                parent || '_p' || to_char(week, 'YYYYMMDD'), parent, week::text, (week + 7)::text
+            );
+            week := week + 7;
+        END LOOP;
+    END LOOP;
+END $$;
+
+-- Страховка на случай пропущенного обслуживания; maintenance переносит строки из неё в новые секции
+CREATE TABLE sessions_default PARTITION OF sessions DEFAULT;
+CREATE TABLE refresh_tokens_default PARTITION OF refresh_tokens DEFAULT;
+
+-- Переносятся только живые строки, истёкшие уходят вместе со старой таблицей
+INSERT INTO sessions (id, user_id, token, expires_at, created_at)
+SELECT id, user_id, token, expires_at, created_at
+FROM sessions_unpartitioned
+WHERE expires_at > CURRENT_TIMESTAMP;
+
+INSERT INTO refresh_tokens (id, user_id, token_hash, created_at, expires_at, revoked)
+SELECT id, user_id, token_hash, created_at, expires_at, revoked
+FROM refresh_tokens_unpartitioned
+WHERE expires_at > CURRENT_TIMESTAMP;
+
+ALTER SEQUENCE sessions_id_seq OWNED BY sessions.id;
+ALTER SEQUENCE refresh_tokens_id_seq OWNED BY refresh_tokens.id;
+
+DROP TABLE sessions_unpartitioned;
+DROP TABLE refresh_tokens_unpartitioned;
+
+-- Поиск по токену обслуживают уникальные индексы (token, expires_at) и (token_hash, expires_at)
+CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user_id ON refresh_tokens(user_id);
+
+COMMENT ON TABLE sessions IS 'Сессии, секционированные по expires_at (неделя на секцию)';
+COMMENT ON TABLE refresh_tokens IS 'Refresh-токены, секционированные по expires_at (неделя на секцию)';
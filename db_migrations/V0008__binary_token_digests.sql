@@ -0,0 +1,28 @@
+-- Ключи токенов хранятся как 32-байтный SHA-256 (BYTEA) вместо текста: сырой токен
+-- сессии (43 символа) и hex-строки refresh/auth-токенов (64 символа). Ключ и индекс по
+-- нему вдвое меньше, горячие индексы дольше остаются в shared buffers, сравнение
+-- побайтовое без учёта collation. Сами токены сессий в БД больше не хранятся.
+
+-- Сессии: клиенты продолжают присылать прежние токены, auth хеширует их при проверке
+ALTER TABLE sessions ADD COLUMN token_hash BYTEA;
+UPDATE sessions SET token_hash = sha256(convert_to(token, 'UTF8'));
+ALTER TABLE sessions ALTER COLUMN token_hash SET NOT NULL;
+ALTER TABLE sessions ADD CONSTRAINT uq_sessions_token_hash UNIQUE (token_hash, expires_at);
+ALTER TABLE sessions DROP CONSTRAINT uq_sessions_token;
+ALTER TABLE sessions DROP COLUMN token;
+
+-- Refresh- и auth-токены уже хранятся хешами, меняется только представление
+ALTER TABLE refresh_tokens
+    ALTER COLUMN token_hash TYPE BYTEA USING decode(token_hash, 'hex');
+
+DROP INDEX IF EXISTS idx_telegram_auth_tokens_hash;
+ALTER TABLE telegram_auth_tokens
+    ALTER COLUMN token_hash TYPE BYTEA USING decode(token_hash, 'hex');
+
+ALTER TABLE sessions ADD CONSTRAINT ck_sessions_token_hash CHECK (octet_length(token_hash) = 32);
+ALTER TABLE refresh_tokens ADD CONSTRAINT ck_refresh_tokens_hash CHECK (octet_length(token_hash) = 32);
+ALTER TABLE telegram_auth_tokens ADD CONSTRAINT ck_telegram_auth_tokens_hash CHECK (octet_length(token_hash) = 32);
+
+COMMENT ON COLUMN sessions.token_hash IS 'SHA-256 токена сессии, 32 байта';
+COMMENT ON COLUMN refresh_tokens.token_hash IS 'SHA-256 refresh-токена, 32 байта';
+COMMENT ON COLUMN telegram_auth_tokens.token_hash IS 'SHA-256 токена авторизации, 32 байта';
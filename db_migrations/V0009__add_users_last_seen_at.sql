@@ -0,0 +1,9 @@
+-- Время последней активности пользователя. Пишется не на каждый запрос, а пачками:
+-- auth копит отметки в памяти и сбрасывает их одним UPDATE ... FROM (VALUES ...).
+ALTER TABLE users ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP;
+
+-- Свободное место на страницах позволяет HOT-обновления: last_seen_at и last_login_at
+-- не индексированы, поэтому новая версия строки остаётся на той же странице без записей в индексы
+ALTER TABLE users SET (fillfactor = 90);
+
+COMMENT ON COLUMN users.last_seen_at IS 'Последняя проверка сессии, вход или refresh; обновляется пачками с задержкой до ACTIVITY_FLUSH_INTERVAL';
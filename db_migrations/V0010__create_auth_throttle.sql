@@ -0,0 +1,12 @@
+-- Общие счётчики попыток входа и регистрации по окнам фиксированной длины (THROTTLE_WINDOW).
+-- Экземпляры auth отсекают перебор локально и раз в несколько секунд добавляют сюда свои
+-- попытки одним INSERT ... ON CONFLICT, получая суммарное число по всем экземплярам.
+-- key — первые 16 байт sha256('email:...' или 'ip:...'), сами адреса не хранятся.
+CREATE TABLE IF NOT EXISTS auth_throttle (
+    key BYTEA NOT NULL,
+    window_id INTEGER NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT pk_auth_throttle PRIMARY KEY (key, window_id)
+) WITH (fillfactor = 70);
+
+COMMENT ON TABLE auth_throttle IS 'Счётчики попыток входа и регистрации; прошедшие окна удаляет auth ?action=maintenance';
@@ -9,6 +9,8 @@ export interface User {
 export interface AuthResponse {
   message: string;
   token: string;
+  refresh_token?: string;
+  expires_in?: number;
   user: User;
 }
 
@@ -35,6 +37,9 @@ export const authService = {
 
     localStorage.setItem('auth_token', data.token);
     localStorage.setItem('user', JSON.stringify(data.user));
+    if (data.refresh_token) {
+      localStorage.setItem('refresh_token', data.refresh_token);
+    }
     
     return data;
   },
@@ -56,11 +61,14 @@ export const authService = {
 
     localStorage.setItem('auth_token', data.token);
     localStorage.setItem('user', JSON.stringify(data.user));
+    if (data.refresh_token) {
+      localStorage.setItem('refresh_token', data.refresh_token);
+    }
     
     return data;
   },
 
-  async verify(): Promise<VerifyResponse | null> {
+  async verify(retry = true): Promise<VerifyResponse | null> {
     const token = localStorage.getItem('auth_token');
     
     if (!token) {
@@ -78,6 +86,9 @@ export const authService = {
       const data = await response.json();
       
       if (!response.ok) {
+        if (retry && await this.refresh()) {
+          return this.verify(false);
+        }
         this.logout();
         return null;
       }
@@ -89,8 +100,52 @@ export const authService = {
     }
   },
 
+  async refresh(): Promise<boolean> {
+    const refreshToken = localStorage.getItem('refresh_token');
+
+    if (!refreshToken) {
+      return false;
+    }
+
+    try {
+      const response = await fetch(`${AUTH_URL}?action=refresh`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ refresh_token: refreshToken }),
+      });
+
+      if (!response.ok) {
+        return false;
+      }
+
+      const data = await response.json();
+      localStorage.setItem('auth_token', data.token);
+      localStorage.setItem('user', JSON.stringify(data.user));
+      return true;
+    } catch {
+      return false;
+    }
+  },
+
   logout() {
+    const token = localStorage.getItem('auth_token');
+    const refreshToken = localStorage.getItem('refresh_token');
+
+    if (token || refreshToken) {
+      fetch(`${AUTH_URL}?action=logout`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          ...(token ? { 'Authorization': `Bearer ${token}` } : {}),
+        },
+        body: JSON.stringify({ refresh_token: refreshToken || '' }),
+      }).catch(() => undefined);
+    }
+
     localStorage.removeItem('auth_token');
+    localStorage.removeItem('refresh_token');
     localStorage.removeItem('user');
   },
 
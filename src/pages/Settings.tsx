@@ -36,10 +36,12 @@ export default function Settings() {
     loadProviders();
   }, []);
 
-  const loadProviders = async () => {
+  // fresh: после своей привязки/отвязки браузер не должен ревалидировать старый ETag
+  const loadProviders = async (fresh = false) => {
     try {
       const token = authService.getToken();
       const response = await fetch('https://functions.poehali.dev/649614a3-d46b-4fac-9521-83ad75a892c5', {
+        cache: fresh ? 'reload' : 'default',
         headers: {
           'Authorization': `Bearer ${token}`,
         },
@@ -83,7 +85,7 @@ export default function Settings() {
         description: 'Провайдер отвязан',
       });
 
-      loadProviders();
+      loadProviders(true);
     } catch (error: any) {
       toast({
         title: 'Ошибка',